@@ -1,86 +1,575 @@
-import sys
-import base64
 import subprocess
 import os
 import glob
+import json
 import time
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import random
+import hashlib
+import argparse
+import tempfile
+import fcntl
+from urllib.parse import urlparse
+from scheduler import Scheduler, DEFAULT_LIMITS
+from results import details_file_name
+from journal import ScanJournal, CHECKPOINT_INTERVAL
+from records import CaptureStore, RecordWriter, iter_records, record_file_name, captures_directory
 
-# Fonction pour capturer une page avec Aquatone et convertir en Base64
+try:
+    from playwright.async_api import async_playwright  # Optionnel : moteur de capture par navigateur
+except ImportError:
+    async_playwright = None
+
+# Taille de la fenêtre des captures (celle utilisée par Aquatone)
+VIEWPORT = {"width": 1440, "height": 900}
+
+# Nombre maximal de cibles transmises à un même processus Aquatone
+DEFAULT_BATCH_SIZE = 500
+
+# Nombre maximal d'enregistrements en cours de capture : au-delà, la lecture du fichier des sondes attend
+# qu'une capture se termine (deux lots Aquatone, pour que les lots restent pleins)
+MAX_PENDING_RECORDS = 2 * DEFAULT_BATCH_SIZE
+
+# Cache des captures d'un scan à l'autre : répertoire et durée de validité par défaut (en heures)
+CACHE_DIRECTORY = "./captures/cache"
+DEFAULT_CACHE_TTL = 24
+
+# Reprises des captures échouées : tentatives par capture, délais d'attente (en secondes) et
+# nombre d'échecs consécutifs au-delà duquel un hôte (sous-domaine et adresse IP) n'est plus capturé
+DEFAULT_MAX_ATTEMPTS = 2
+BACKOFF_BASE_DELAY = 2
+BACKOFF_MAX_DELAY = 30
+DEFAULT_HOST_FAILURE_BUDGET = 6
+
+# Fonction pour capturer une page avec Aquatone et renvoyer le contenu PNG
+# Une seule tentative : les reprises sont planifiées par CaptureRetrier, sans bloquer un thread du pool
 def capture_aquatone(subdomain, port):
-    max_attempts = 2  # Nombre maximum de tentatives
-    delay_between_attempts = 3  # Intervalle en secondes entre les tentatives
+    try:
+        # Spécifier un répertoire de sortie pour stocker les captures
+        output_dir = f"./captures/{subdomain}_{port}"
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Appel d'Aquatone pour capturer la page
+        aquatone_cmd = f"echo {subdomain} | aquatone -ports {port} -out {output_dir}"
+        subprocess.run(aquatone_cmd, shell=True, check=True)
+
+        # Chercher les fichiers PNG dans le dossier screenshots
+        screenshot_pattern = f"{output_dir}/screenshots/*.png"
+        screenshots = glob.glob(screenshot_pattern)
+
+        if screenshots:
+            # Prendre le premier fichier trouvé (s'il y a plusieurs captures)
+            screenshot_path = screenshots[0]
+            with open(screenshot_path, "rb") as image_file:
+                return image_file.read()
+        else:
+            print(f"Pas de fichier PNG trouvé dans {output_dir}/screenshots/")
+    except Exception as e:
+        print(f"Erreur lors de la capture de {subdomain} sur le port {port} : {e}")
+
+    # En cas d'échec, retourner une capture vide
+    return b""
+
+# Fonction pour capturer un lot de cibles avec un seul processus Aquatone
+def capture_aquatone_batch(targets):
+    """
+    Transmet toutes les URL du lot à Aquatone sur l'entrée standard (Aquatone les capture en parallèle),
+    puis retrouve la capture de chaque cible grâce au fichier aquatone_session.json.
+
+    Args:
+        targets (list of tuples): Cibles (sous-domaine, port).
+
+    Returns:
+        dict: (sous-domaine en minuscules, port) -> contenu PNG, pour les cibles capturées.
+    """
+    os.makedirs("./captures", exist_ok=True)
+    urls = "\n".join(f"{'https' if port == '443' else 'http'}://{subdomain}" for subdomain, port in targets)
+
+    # Sortie d'Aquatone (captures, pages HTML, en-têtes, session) supprimée une fois les captures lues
+    with tempfile.TemporaryDirectory(prefix="lot_", dir="./captures") as output_dir:
+        result = subprocess.run(["aquatone", "-out", output_dir], input=urls + "\n", text=True, stdout=subprocess.DEVNULL)
+        if result.returncode != 0:
+            print(f"Erreur lors de l'exécution d'Aquatone pour un lot de {len(targets)} cibles (code {result.returncode})")
+
+        session_path = os.path.join(output_dir, "aquatone_session.json")
+        if not os.path.exists(session_path):
+            print(f"Pas de fichier aquatone_session.json dans {output_dir}")
+            return {}
+        with open(session_path) as session_file:
+            session = json.load(session_file)
+
+        screenshots = {}
+        for page in session.get("pages", {}).values():
+            if not page.get("hasScreenshot") or not page.get("screenshotPath"):
+                continue
+            url = urlparse(page["url"])
+            port = str(url.port or (443 if url.scheme == "https" else 80))
+            with open(os.path.join(output_dir, page["screenshotPath"]), "rb") as image_file:
+                screenshots[(url.hostname, port)] = image_file.read()
+    return screenshots
+
+class AquatoneBatchEngine:
+    """
+    Moteur de capture Aquatone par lots : les demandes de capture sont regroupées et chaque lot (jusqu'à
+    batch_size cibles) est confié à un seul processus Aquatone, au lieu d'un processus par hôte et par port.
+    Les cibles reprises par CaptureRetrier rejoignent simplement un lot suivant.
+
+    Args:
+        scheduler (Scheduler): Ordonnanceur ; l'étape "capture" borne le nombre de processus Aquatone simultanés.
+        batch_size (int): Nombre maximal de cibles par lot.
+        flush_delay (float): Délai (en secondes) avant l'envoi d'un lot incomplet.
+    """
 
-    for attempt in range(max_attempts):
+    def __init__(self, scheduler, batch_size=DEFAULT_BATCH_SIZE, flush_delay=0.5):
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self.pending = []  # (sous-domaine, port, future)
+        self.flush_handle = None
+        self.tasks = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def capture(self, subdomain, port):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((subdomain, port, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self.run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, batch):
+        print(f"⚙  Capture d'un lot de {len(batch)} cibles avec Aquatone...")
         try:
-            # Spécifier un répertoire de sortie pour stocker les captures
-            output_dir = f"./captures/{subdomain}_{port}"
-            os.makedirs(output_dir, exist_ok=True)
-
-            # Appel d'Aquatone pour capturer la page
-            aquatone_cmd = f"echo {subdomain} | aquatone -ports {port} -out {output_dir}"
-            subprocess.run(aquatone_cmd, shell=True, check=True)
-
-            # Chercher les fichiers PNG dans le dossier screenshots
-            screenshot_pattern = f"{output_dir}/screenshots/*.png"
-            screenshots = glob.glob(screenshot_pattern)
-
-            if screenshots:
-                # Prendre le premier fichier trouvé (s'il y a plusieurs captures)
-                screenshot_path = screenshots[0]
-                with open(screenshot_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode("utf-8").replace("\n", "")
-                return base64_image
-            else:
-                print(f"Pas de fichier PNG trouvé dans {output_dir}/screenshots/")
-                time.sleep(delay_between_attempts)  # Attente avant la prochaine tentative
+            screenshots = await self.scheduler.run_blocking(
+                "capture", capture_aquatone_batch, [(subdomain, port) for subdomain, port, _ in batch]
+            )
         except Exception as e:
-            print(f"Erreur lors de la capture de {subdomain} sur le port {port} : {e}")
-            time.sleep(delay_between_attempts)
+            print(f"Erreur lors de la capture d'un lot de {len(batch)} cibles : {e}")
+            screenshots = {}
+
+        for subdomain, port, future in batch:
+            if not future.done():
+                future.set_result(screenshots.get((subdomain.lower(), port), b""))
+
+class AquatoneEngine:
+    """
+    Moteur de capture historique : un processus Aquatone par capture, exécuté dans le pool de l'étape "capture".
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def capture(self, subdomain, port):
+        return await self.scheduler.run_blocking("capture", capture_aquatone, subdomain, port)
+
+class BrowserEngine:
+    """
+    Moteur de capture par navigateurs sans interface gardés ouverts pendant toute l'étape : chaque capture
+    n'ouvre qu'un onglet, réparti sur le navigateur le moins chargé du pool. Le débit dépend ainsi du temps
+    de chargement des pages et non plus du démarrage d'un navigateur par capture.
+
+    Nécessite Playwright (pip install playwright && playwright install chromium).
+
+    Args:
+        scheduler (Scheduler): Ordonnanceur ; l'étape "capture" borne le nombre d'onglets ouverts.
+        browsers (int): Nombre de navigateurs du pool.
+        timeout (int): Délai maximal de chargement d'une page, en secondes.
+    """
+
+    def __init__(self, scheduler, browsers=2, timeout=30):
+        self.scheduler = scheduler
+        self.browser_count = browsers
+        self.timeout = timeout
+        self.playwright = None
+        self.browsers = []
+        self.in_flight = []
+        self.locks = []
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        for _ in range(self.browser_count):
+            self.browsers.append(await self.launch())
+            self.in_flight.append(0)
+            self.locks.append(asyncio.Lock())
+        return self
 
-    # Si toutes les tentatives échouent, retourner une chaîne vide
-    return ""
+    async def __aexit__(self, exc_type, exc, tb):
+        for browser in self.browsers:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        await self.playwright.stop()
+
+    async def launch(self):
+        return await self.playwright.chromium.launch(headless=True, args=["--ignore-certificate-errors"])
+
+    async def browser(self, index):
+        """
+        Renvoie le navigateur d'un emplacement du pool, relancé s'il s'est arrêté. Le relancement est protégé par
+        le verrou de l'emplacement : les captures qui trouvent le même navigateur arrêté attendent le même
+        remplaçant, et l'ancienne instance est fermée.
+        """
+        async with self.locks[index]:
+            browser = self.browsers[index]
+            if not browser.is_connected():
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+                self.browsers[index] = await self.launch()
+            return self.browsers[index]
+
+    async def capture(self, subdomain, port):
+        url = f"{'https' if port == '443' else 'http'}://{subdomain}"
+
+        async with self.scheduler.stage("capture"):
+            # Choisir le navigateur qui a le moins d'onglets ouverts (relancé s'il s'est arrêté, voir browser)
+            index = min(range(len(self.browsers)), key=self.in_flight.__getitem__)
+            self.in_flight[index] += 1
+
+            context = None
+            try:
+                browser = await self.browser(index)
+                context = await browser.new_context(viewport=VIEWPORT, ignore_https_errors=True)
+                page = await context.new_page()
+                await page.goto(url, timeout=self.timeout * 1000, wait_until="load")
+                return await page.screenshot(type="png")
+            except Exception as e:
+                print(f"Erreur lors de la capture de {subdomain} sur le port {port} : {e}")
+                return b""
+            finally:
+                self.in_flight[index] -= 1
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+
+class CaptureRetrier:
+    """
+    Reprise des captures échouées, commune à tous les moteurs : chaque nouvelle tentative est planifiée
+    après une attente exponentielle aléatoire (jitter) dans la boucle asyncio, sans occuper d'emplacement
+    du pool de captures pendant l'attente. Un budget d'échecs consécutifs par hôte (sous-domaine et adresse IP :
+    les sous-domaines servis par une même adresse IP ont chacun le leur) évite qu'une cible instable ne monopolise
+    l'étape : une fois épuisé, ses captures sont abandonnées.
+
+    Args:
+        engine: Moteur de capture (AquatoneBatchEngine, AquatoneEngine ou BrowserEngine).
+        max_attempts (int): Nombre de tentatives par capture.
+        host_failure_budget (int): Nombre d'échecs consécutifs tolérés par hôte.
+    """
+
+    def __init__(self, engine, max_attempts=DEFAULT_MAX_ATTEMPTS, host_failure_budget=DEFAULT_HOST_FAILURE_BUDGET):
+        self.engine = engine
+        self.max_attempts = max_attempts
+        self.host_failure_budget = host_failure_budget
+        self.failures = {}  # (sous-domaine, adresse IP) -> nombre d'échecs consécutifs
+        self.skipped = 0    # Captures abandonnées car le budget de l'hôte était épuisé
+
+    async def capture(self, subdomain, port, ip=None):
+        host = (subdomain, ip)
+        for attempt in range(self.max_attempts):
+            if self.failures.get(host, 0) >= self.host_failure_budget:
+                self.skipped += 1
+                return b""
+
+            image = await self.engine.capture(subdomain, port)
+            if image:
+                self.failures.pop(host, None)
+                return image
+            self.failures[host] = self.failures.get(host, 0) + 1
+
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX_DELAY, BACKOFF_BASE_DELAY * 2 ** attempt)))
+        return b""
+
+# Fonction pour créer le moteur de capture demandé
+def make_capture_engine(kind, scheduler, browsers=2):
+    """
+    Args:
+        kind (str): "aquatone" (lots de cibles par processus Aquatone), "aquatone_single" (un processus par capture)
+            ou "browser" (pool de navigateurs persistants).
+
+    Returns:
+        AquatoneBatchEngine, AquatoneEngine ou BrowserEngine: Moteur à utiliser avec `async with`.
+    """
+    if kind == "browser":
+        if async_playwright is not None:
+            return BrowserEngine(scheduler, browsers)
+        print("⚠  Playwright n'est pas installé, utilisation d'Aquatone pour les captures.")
+    if kind == "aquatone_single":
+        return AquatoneEngine(scheduler)
+    return AquatoneBatchEngine(scheduler)
+
+# Fonction pour lire les empreintes des pages calculées par les sondes (fichier Details_*.jsonl)
+def read_fingerprints(details_file):
+    """
+    Returns:
+        dict: (sous-domaine, port) -> empreinte de la page ; vide si le fichier n'existe pas.
+    """
+    fingerprints = {}
+    if not os.path.exists(details_file):
+        return fingerprints
+    with open(details_file) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for port, details in record.get("ports", {}).items():
+                if details.get("fingerprint"):
+                    fingerprints[(record["subdomain"], port)] = details["fingerprint"]
+    return fingerprints
+
+class ScreenshotCache:
+    """
+    Cache des captures d'un scan à l'autre : une capture est réutilisée tant que l'empreinte de la page
+    (code HTTP, Content-Length, ETag, Last-Modified et corps, calculée par la sonde) n'a pas changé et
+    qu'elle a moins de ttl heures. Les images sont stockées une seule fois par contenu dans le répertoire
+    du cache, indexées par index.json.
+
+    Plusieurs scans peuvent partager le cache : chacun y tient un verrou partagé tant qu'il l'utilise, les
+    images et l'index sont écrits de façon atomique et l'index est fusionné avec celui du disque sous verrou.
+
+    Args:
+        fingerprints (dict): Empreintes du scan courant, voir read_fingerprints.
+        directory (str): Répertoire du cache.
+        ttl (float): Durée de validité d'une capture, en heures.
+    """
+
+    def __init__(self, fingerprints, directory=CACHE_DIRECTORY, ttl=DEFAULT_CACHE_TTL):
+        self.fingerprints = fingerprints
+        self.directory = directory
+        self.ttl = ttl * 3600
+        self.index_path = os.path.join(directory, "index.json")
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # Verrou partagé pendant toute l'utilisation du cache : les images ne sont supprimées que sans autre scan
+        self.users_lock = open(os.path.join(directory, ".users.lock"), "a")
+        fcntl.flock(self.users_lock, fcntl.LOCK_SH)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path) as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get(self, subdomain, port):
+        fingerprint = self.fingerprints.get((subdomain, port))
+        entry = self.index.get(f"{subdomain}:{port}")
+        if (
+            fingerprint and entry and entry["fingerprint"] == fingerprint
+            and time.time() - entry["captured_at"] < self.ttl
+        ):
+            try:
+                with open(os.path.join(self.directory, f"{entry['sha256']}.png"), "rb") as image_file:
+                    self.hits += 1
+                    return image_file.read()
+            except OSError:
+                pass
+        self.misses += 1
+        return b""
+
+    def put(self, subdomain, port, content):
+        fingerprint = self.fingerprints.get((subdomain, port))
+        if not fingerprint or not content:
+            return
+        sha256 = hashlib.sha256(content).hexdigest()
+        image_path = os.path.join(self.directory, f"{sha256}.png")
+        if not os.path.exists(image_path):
+            # Écriture atomique : un autre scan ne lit jamais une image à moitié écrite
+            temporary_path = f"{image_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as image_file:
+                image_file.write(content)
+            os.replace(temporary_path, image_path)
+        self.index[f"{subdomain}:{port}"] = {"fingerprint": fingerprint, "sha256": sha256, "captured_at": time.time()}
+
+    def save(self):
+        """
+        Enregistre l'index, fusionné avec celui du disque (la capture la plus récente de chaque page l'emporte), en
+        écartant les captures expirées, puis libère le cache. Les images qui ne sont plus référencées ne sont
+        supprimées (voir prune) que si aucun autre scan n'utilise le cache.
+        """
+        with open(os.path.join(self.directory, ".index.lock"), "a") as index_lock:
+            fcntl.flock(index_lock, fcntl.LOCK_EX)
+            index = self._read_index()
+            for key, entry in self.index.items():
+                if key not in index or index[key]["captured_at"] < entry["captured_at"]:
+                    index[key] = entry
+            now = time.time()
+            self.index = {key: entry for key, entry in index.items() if now - entry["captured_at"] < self.ttl}
+            temporary_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(self.index, file)
+            os.replace(temporary_path, self.index_path)
+
+            try:
+                # Passage au verrou exclusif sans attendre : échoue si un autre scan utilise le cache
+                fcntl.flock(self.users_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass
+            else:
+                self.prune()
+        self.users_lock.close()
+
+    def prune(self):
+        """
+        Supprime les images qui ne sont plus référencées par l'index. À n'appeler que sous le verrou exclusif du
+        cache (voir save).
+        """
+        referenced = {f"{entry['sha256']}.png" for entry in self.index.values()}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".png") and filename not in referenced:
+                os.remove(os.path.join(self.directory, filename))
 
 # Fonction pour traiter un sous-domaine (HTTP/HTTPS)
-def process_subdomain(row):
-    # Extraction des données
-    domain, subdomain, http_codes, ports, ip, date_time = row.strip().split(',')
+# engine est le CaptureRetrier du moteur de capture ; les captures sont enregistrées dans captures (CaptureStore)
+async def process_subdomain(record, engine, captures, cache=None):
+    ports_list = record.ports.split("-")
+    http_codes_list = record.http_codes.split("-")
+
+    # Chaque capture occupe un emplacement de l'étape "capture" de l'ordonnanceur
+    async def capture(port):
+        if port in ports_list and not any(code.startswith(("4", "5")) for code in http_codes_list):
+            # Page inchangée depuis une capture récente : la capture est réutilisée
+            content = cache.get(record.subdomain, port) if cache else b""
+            if not content:
+                content = await engine.capture(record.subdomain, port, record.ip_address)
+                if cache:
+                    cache.put(record.subdomain, port, content)
+            return captures.put(content)
+        return ""
+
+    # Capture HTTP (port 80) et HTTPS (port 443) sauf pour les erreurs 4xx et 5xx
+    image_http, image_https = await asyncio.gather(capture("80"), capture("443"))
+
+    # Retourner l'enregistrement avec les empreintes des captures (vides si aucune capture)
+    return record._replace(image_http=image_http, image_https=image_https)
 
-    ports_list = ports.split("-")
-    http_codes_list = http_codes.split("-")
+# Lecture du fichier des sondes et captures bornées par l'ordonnanceur
+# Les captures des pages inchangées depuis moins de cache_ttl heures sont reprises du cache (0 pour le désactiver)
+# Avec un journal de scan (voir journal.ScanJournal), chaque enregistrement capturé y est conservé : une exécution
+# reprise après une interruption ne refait pas les captures déjà faites
+# Les enregistrements sont lus au fur et à mesure (au plus MAX_PENDING_RECORDS en cours de capture) et écrits dans
+# output_file (par défaut records.record_file_name(input_file)) dès que leurs captures sont terminées, dans l'ordre
+# où elles se terminent ; le fichier n'est mis en place qu'à la fin. Les captures sont écrites dans le répertoire
+# voisin (records.captures_directory) ; renvoie le nombre d'enregistrements écrits
+def process_file(input_file, scheduler=None, engine="aquatone", browsers=2, cache_ttl=DEFAULT_CACHE_TTL,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, host_failure_budget=DEFAULT_HOST_FAILURE_BUDGET, journal=None,
+                 output_file=None):
+    scheduler = scheduler or Scheduler()
+    output_file = output_file or record_file_name(input_file)
+    captures = CaptureStore(captures_directory(output_file))
 
-    # Capture HTTP (port 80) sauf pour les erreurs 4xx et 5xx
-    if "80" in ports_list and not any(code.startswith(("4", "5")) for code in http_codes_list):
-        image_http_base64 = capture_aquatone(subdomain, "80")
-    else:
-        image_http_base64 = ""
+    cache = ScreenshotCache(read_fingerprints(details_file_name(input_file)), ttl=cache_ttl) if cache_ttl > 0 else None
+    if journal and journal.captured_count():
+        print(f"⚙  Reprise : {journal.captured_count()} sous-domaines déjà capturés.")
 
-    # Capture HTTPS (port 443) sauf pour les erreurs 4xx et 5xx
-    if "443" in ports_list and not any(code.startswith(("4", "5")) for code in http_codes_list):
-        image_https_base64 = capture_aquatone(subdomain, "443")
-    else:
-        image_https_base64 = ""
+    async def run(writer):
+        recorded = 0
 
-    # Format des images avec une virgule finale même si les images sont vides
-    images_base64 = f"{image_http_base64},{image_https_base64}".replace("\n", "") if image_http_base64 or image_https_base64 else ","
+        async def capture_record(record):
+            nonlocal recorded
+            result = await process_subdomain(record, retrier, captures, cache)
+            if journal:
+                journal.add_capture(result)
+                recorded += 1
+                if recorded % CHECKPOINT_INTERVAL == 0:
+                    journal.commit()
+            return result
 
-    # Retourner la ligne formatée
-    return f"{domain},{subdomain},{http_codes},{ports},{ip},{date_time},{images_base64}"
+        async with make_capture_engine(engine, scheduler, browsers) as capture_engine:
+            retrier = CaptureRetrier(capture_engine, max_attempts, host_failure_budget)
+            pending = set()
+            try:
+                for record in iter_records(input_file):
+                    captured = journal.captured_record(record.domain, record.subdomain) if journal else None
+                    if captured is not None:
+                        writer.write(captured)
+                        continue
 
-# Lecture du fichier TXT et multithreading avec concurrent.futures
-def process_file(input_file):
-    with open(input_file, "r") as infile:
-        lines = infile.readlines()
+                    # Fenêtre pleine : les enregistrements capturés sont écrits avant d'en lire d'autres
+                    if len(pending) >= MAX_PENDING_RECORDS:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            writer.write(task.result())
 
-        with ThreadPoolExecutor() as executor:
-            results = list(executor.map(process_subdomain, lines))
+                    # Les captures d'une exécution précédente sont ignorées : elles sont refaites
+                    pending.add(asyncio.create_task(capture_record(record._replace(image_http="", image_https=""))))
 
-    # Écriture du fichier de sortie avec les résultats dans le même fichier
-    with open(input_file, "w") as outfile:
-        for result in results:
-            outfile.write(result + "\n")
+                for task in asyncio.as_completed(pending):
+                    writer.write(await task)
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                if journal:
+                    journal.commit()
+            if retrier.skipped:
+                print(f"⚠  {retrier.skipped} captures abandonnées (budget d'échecs de l'hôte épuisé).")
+
+    # Le fichier de sortie n'est remplacé qu'une fois toutes les captures écrites (voir RecordWriter)
+    with RecordWriter(output_file) as writer:
+        try:
+            asyncio.run(run(writer))
+        finally:
+            scheduler.close()
+
+    if cache:
+        cache.save()
+        print(f"⚙  Cache des captures : {cache.hits} réutilisées, {cache.misses} réalisées.")
+    return writer.count
 
 # Exemple d'exécution
 if __name__ == "__main__":
-    input_file = sys.argv[1]  # Utilisation du même fichier en entrée et sortie
-    process_file(input_file)
+    parser = argparse.ArgumentParser(description="Capture d'écran des sous-domaines d'un fichier de résultats.")
+    parser.add_argument("input_file", help="Fichier de résultats des sondes.")
+    parser.add_argument("-o", "--output_file", help="Fichier d'enregistrements produit (par défaut le fichier d'entrée avec l'extension .rec, captures dans le répertoire <nom>_captures).")
+    parser.add_argument("--max_captures", type=int, default=DEFAULT_LIMITS["capture"], help="Nombre maximal de captures simultanées.")
+    parser.add_argument("--engine", choices=["aquatone", "aquatone_single", "browser"], default="aquatone", help="Moteur de capture : Aquatone par lots de cibles, un processus Aquatone par capture, ou un pool de navigateurs persistants (Playwright).")
+    parser.add_argument("--browsers", type=int, default=2, help="Nombre de navigateurs du pool avec --engine browser.")
+    parser.add_argument("--cache_ttl", type=float, default=DEFAULT_CACHE_TTL, help="Durée (en heures) pendant laquelle la capture d'une page inchangée est réutilisée ; 0 pour désactiver le cache.")
+    parser.add_argument("--max_attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Nombre de tentatives par capture (attente exponentielle aléatoire entre deux tentatives).")
+    parser.add_argument("--host_failure_budget", type=int, default=DEFAULT_HOST_FAILURE_BUDGET, help="Nombre d'échecs consécutifs tolérés par hôte (sous-domaine et adresse IP) avant d'abandonner ses captures.")
+    parser.add_argument("--journal", help="Journal du scan (fichier SQLite, voir main.py --resume) où enregistrer les captures faites, pour ne pas les refaire après une interruption.")
+    args = parser.parse_args()
+
+    journal = ScanJournal(args.journal) if args.journal else None
+    try:
+        process_file(
+            args.input_file, Scheduler({"capture": args.max_captures}), args.engine, args.browsers, args.cache_ttl,
+            args.max_attempts, args.host_failure_budget, journal, args.output_file
+        )
+    finally:
+        if journal:
+            journal.close()
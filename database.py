@@ -1,6 +1,29 @@
 import os
+import sys
+import io
+import json
+import time
+import base64
+import binascii
+import hashlib
+import ipaddress
 import psycopg2
+from psycopg2.extras import execute_values
 import argparse
+from results import details_file_name
+from records import CaptureStore, iter_records, captures_directory
+
+# Nombre de lignes envoyées par COPY en une seule fois
+DEFAULT_BATCH_SIZE = 1000
+
+# Colonnes alimentées par l'ingestion d'un fichier de résultats
+SCAN_RESULTS_COLUMNS = (
+    "scan_id", "domain", "subdomain", "http_codes", "ports", "ip_address",
+    "scan_time", "image_http_sha256", "image_https_sha256", "probe_details"
+)
+
+# Colonnes copiées dans la table temporaire de l'ingestion (les détails des sondes sont joints ensuite)
+STAGED_COLUMNS = SCAN_RESULTS_COLUMNS[:-1]
 
 # Fonction pour se connecter à la base de données
 def connect_db():
@@ -17,67 +40,377 @@ def connect_db():
         print(f"Erreur lors de la connexion à la base de données: {str(e)}")
         return None
 
-# Fonction pour obtenir le prochain scan_id
-def get_next_scan_id():
-    connection = connect_db()
-    if connection is None:
-        return None
+# Fonction pour créer les tables, colonnes et index annexes s'ils n'existent pas encore
+# Chaque élément est vérifié avant d'être créé : un schéma déjà installé par l'administrateur
+# (voir Installation_Configuration_PostgreSQL.md) ne demande aucun droit de propriétaire
+def ensure_schema(connection):
+    with connection, connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('scans'), to_regclass('screenshots'), to_regclass('scan_results_scan_domain_subdomain_idx')")
+        scans_exists, screenshots_exists, index_exists = (value is not None for value in cursor.fetchone())
+
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'scan_results' AND column_name IN ('image_http_sha256', 'image_https_sha256', 'probe_details')
+        """)
+        existing_columns = {row[0] for row in cursor.fetchall()}
+        sha256_columns_exist = {'image_http_sha256', 'image_https_sha256'} <= existing_columns
+
+        if not scans_exists:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    scan_id SERIAL PRIMARY KEY,
+                    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    domain_count INTEGER,
+                    subdomain_count INTEGER
+                )
+            """)
+
+            # Première création : reprise des scans existants et alignement de la séquence
+            cursor.execute("""
+                INSERT INTO scans (scan_id, started_at, finished_at, domain_count, subdomain_count)
+                SELECT scan_id, MIN(scan_time), MAX(scan_time), COUNT(DISTINCT domain), COUNT(*)
+                FROM scan_results
+                WHERE scan_id IS NOT NULL
+                GROUP BY scan_id
+            """)
+            cursor.execute("""
+                SELECT setval(pg_get_serial_sequence('scans', 'scan_id'), COALESCE(MAX(scan_id), 0) + 1, false)
+                FROM scans
+            """)
+
+        # Stockage des captures hors ligne : une seule copie binaire par contenu, référencée par son empreinte
+        if not screenshots_exists:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS screenshots (
+                    sha256 CHAR(64) PRIMARY KEY,
+                    content BYTEA NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+        if not sha256_columns_exist:
+            cursor.execute("""
+                ALTER TABLE scan_results
+                    ADD COLUMN IF NOT EXISTS image_http_sha256 CHAR(64),
+                    ADD COLUMN IF NOT EXISTS image_https_sha256 CHAR(64)
+            """)
+
+        # Détails des réponses sondées (URL finale, redirections, titre, serveur, certificat TLS...), par port
+        if 'probe_details' not in existing_columns:
+            cursor.execute("ALTER TABLE scan_results ADD COLUMN IF NOT EXISTS probe_details JSONB")
+
+        # Index utilisé par les rapports pour comparer un scan à son prédécesseur
+        if not index_exists:
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS scan_results_scan_domain_subdomain_idx
+                ON scan_results (scan_id, domain, subdomain)
+            """)
+
+# Fonction pour obtenir le prochain scan_id (avec une connexion existante si elle est fournie)
+# L'identifiant vient de la séquence de la table scans : aucune collision entre ingestions concurrentes
+def get_next_scan_id(connection=None):
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+        if connection is None:
+            return None
 
     try:
         cursor = connection.cursor()
-        cursor.execute("SELECT MAX(scan_id) FROM scan_results")
-        result = cursor.fetchone()
-        connection.close()
-
-        # Si aucun scan n'existe encore, retourner 1
-        return (result[0] + 1) if result[0] is not None else 1
+        cursor.execute("INSERT INTO scans DEFAULT VALUES RETURNING scan_id")
+        scan_id = cursor.fetchone()[0]
+        cursor.close()
+        if own_connection:
+            connection.commit()
+        return scan_id
     except Exception as e:
         print(f"Erreur lors de la récupération du prochain scan_id: {str(e)}")
-        connection.close()
         return None
+    finally:
+        if own_connection:
+            connection.close()
+
+# Fonction pour enregistrer la fin d'un scan et ses compteurs dans la table scans
+def finish_scan(cursor, scan_id, domain_count, subdomain_count, started_at=None, finished_at=None):
+    cursor.execute("""
+        UPDATE scans
+        SET started_at = COALESCE(%s, started_at),
+            finished_at = COALESCE(%s, clock_timestamp()),
+            domain_count = %s,
+            subdomain_count = %s
+        WHERE scan_id = %s
+    """, (started_at, finished_at, domain_count, subdomain_count, scan_id))
+
+# Fonction pour décoder une capture Base64 ; renvoie (empreinte sha256, contenu) ou (None, None)
+def decode_screenshot(image_base64):
+    if not image_base64:
+        return None, None
+    try:
+        content = base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError):
+        return None, None
+    return hashlib.sha256(content).hexdigest(), content
+
+# Fonction pour enregistrer des captures dans la table screenshots, sans renvoyer celles déjà connues
+def store_screenshots(cursor, screenshots, known=None, load=None):
+    """
+    Args:
+        cursor: Curseur de la transaction en cours.
+        screenshots (dict): Empreinte sha256 -> contenu PNG, ou None si le contenu est à lire avec load.
+        known (set): Empreintes déjà présentes en base (mis à jour), pour éviter de les redemander.
+        load (callable): Lecture d'une capture par son empreinte (voir records.CaptureStore.get), appelée
+            seulement pour les captures absentes de la base.
+    """
+    known = known if known is not None else set()
+    candidates = [sha256 for sha256 in screenshots if sha256 not in known]
+    if not candidates:
+        return
+
+    cursor.execute("SELECT sha256 FROM screenshots WHERE sha256 = ANY(%s)", (candidates,))
+    known.update(row[0] for row in cursor.fetchall())
+
+    missing = []
+    for sha256 in candidates:
+        if sha256 in known:
+            continue
+        content = screenshots[sha256] if screenshots[sha256] is not None else load(sha256)
+        if content is not None:
+            missing.append((sha256, psycopg2.Binary(content), len(content)))
+    if missing:
+        execute_values(cursor, """
+            INSERT INTO screenshots (sha256, content, size) VALUES %s
+            ON CONFLICT (sha256) DO NOTHING
+        """, missing)
+        known.update(sha256 for sha256, _, _ in missing)
+
+# Fonction pour lire au fil de l'eau les détails des sondes écrits à côté d'un fichier de résultats (Details_*.jsonl)
+def iter_probe_details(input_file):
+    """
+    Yields:
+        tuple: (domaine, sous-domaine, détails par port en JSON) ; rien si le fichier n'existe pas.
+    """
+    details_file = details_file_name(input_file)
+    if not os.path.exists(details_file):
+        return
+    with open(details_file) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield record["domain"], record["subdomain"], json.dumps(record["ports"])
+
+# Fonction pour convertir une valeur au format texte de COPY (\N pour NULL)
+def format_copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
 
-# Fonction pour insérer les résultats de scan dans la base de données
-def insert_scan_result(scan_id, domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64):
+# Fonction pour normaliser l'adresse IP (colonne INET) : les valeurs invalides comme "N/A" deviennent NULL
+def normalize_ip_address(ip_address):
+    try:
+        return str(ipaddress.ip_address(ip_address.strip()))
+    except ValueError:
+        return None
+
+# Fonction pour envoyer un lot de lignes avec COPY FROM STDIN
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(format_copy_value(value) for value in row) + "\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+# Fonction pour charger les détails des sondes, lot par lot, dans une table temporaire de la transaction
+# Les détails sont ensuite joints aux lignes du scan par (domaine, sous-domaine), sans être gardés en mémoire
+def copy_probe_details(cursor, probe_details, batch_size=DEFAULT_BATCH_SIZE):
+    cursor.execute("""
+        CREATE TEMPORARY TABLE probe_details_staging (domain TEXT, subdomain TEXT, details JSONB) ON COMMIT DROP
+    """)
+    batch = []
+    for row in probe_details:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            copy_rows(cursor, "probe_details_staging", ("domain", "subdomain", "details"), batch)
+            batch = []
+    if batch:
+        copy_rows(cursor, "probe_details_staging", ("domain", "subdomain", "details"), batch)
+    cursor.execute("ANALYZE probe_details_staging")
+
+# Fonction pour insérer des enregistrements de résultats dans la base
+def insert_rows(records, captures, probe_details=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Ingère des enregistrements de résultats avec une seule connexion et une seule transaction,
+    par lots envoyés avec COPY FROM STDIN.
+
+    Args:
+        records (iterable): Enregistrements (records.ScanRecord), en mémoire (voir capture.process_file)
+            ou lus au fil de l'eau (voir records.iter_records).
+        captures (CaptureStore): Captures du scan ; seules celles absentes de la table screenshots sont lues.
+        probe_details (iterable): Détails des sondes (domaine, sous-domaine, JSON), voir iter_probe_details ; lus au
+            fil de l'eau dans une table temporaire et joints aux lignes à la fin de l'ingestion.
+        batch_size (int): Nombre de lignes par lot COPY.
+
+    Returns:
+        int: scan_id du scan inséré, ou None en cas d'erreur (rien n'est inséré).
+    """
     connection = connect_db()
     if connection is None:
         return
 
+    start_time = time.time()
+    inserted = 0
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO scan_results (scan_id, domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (scan_id, domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64))
+        ensure_schema(connection)
+
+        # Une seule transaction : validée à la fin, annulée entièrement en cas d'erreur
+        with connection, connection.cursor() as cursor:
+            scan_id = get_next_scan_id(connection)
+            if scan_id is None:
+                print("Erreur lors de la génération du scan_id.")
+                return
+
+            # Les lignes sont copiées dans une table temporaire, puis insérées avec leurs détails en une seule requête
+            copy_probe_details(cursor, probe_details or (), batch_size)
+            cursor.execute("""
+                CREATE TEMPORARY TABLE scan_results_staging (LIKE scan_results) ON COMMIT DROP
+            """)
+
+            domains = set()
+            started_at = finished_at = None
+            batch = []
+            screenshots = {}       # Captures du lot en cours, par empreinte (lues seulement si absentes de la base)
+            known_screenshots = set()
+            for record in records:
+                # Les captures sont stockées une seule fois, la ligne ne garde que leur empreinte
+                image_http_sha256 = record.image_http if captures.has(record.image_http) else None
+                image_https_sha256 = record.image_https if captures.has(record.image_https) else None
+                for sha256 in (image_http_sha256, image_https_sha256):
+                    if sha256:
+                        screenshots[sha256] = None
+                batch.append((scan_id, record.domain, record.subdomain, record.http_codes, record.ports, normalize_ip_address(record.ip_address), record.scan_time, image_http_sha256, image_https_sha256))
+                domains.add(record.domain)
+                started_at = min(started_at or record.scan_time, record.scan_time)
+                finished_at = max(finished_at or record.scan_time, record.scan_time)
+
+                if len(batch) >= batch_size:
+                    store_screenshots(cursor, screenshots, known_screenshots, captures.get)
+                    copy_rows(cursor, "scan_results_staging", STAGED_COLUMNS, batch)
+                    inserted += len(batch)
+                    batch = []
+                    screenshots = {}
+
+            if batch:
+                store_screenshots(cursor, screenshots, known_screenshots, captures.get)
+                copy_rows(cursor, "scan_results_staging", STAGED_COLUMNS, batch)
+                inserted += len(batch)
+
+            # Jointure avec les détails des sondes (le dernier détail d'un sous-domaine sondé plusieurs fois l'emporte)
+            cursor.execute(f"""
+                INSERT INTO scan_results ({', '.join(SCAN_RESULTS_COLUMNS)})
+                SELECT {', '.join(f's.{column}' for column in STAGED_COLUMNS)}, d.details
+                FROM scan_results_staging s
+                LEFT JOIN (
+                    SELECT DISTINCT ON (domain, subdomain) domain, subdomain, details
+                    FROM probe_details_staging
+                    ORDER BY domain, subdomain, ctid DESC
+                ) d ON d.domain = s.domain AND d.subdomain = s.subdomain
+            """)
 
-        connection.commit()
+            # Les bornes du scan sont celles des lignes ingérées (format horodaté triable)
+            finish_scan(cursor, scan_id, len(domains), inserted, started_at, finished_at)
     except Exception as e:
         print(f"Erreur lors de l'insertion des données: {str(e)}")
+        return
     finally:
         connection.close()
 
+    duration = time.time() - start_time
+    throughput = inserted / duration if duration > 0 else inserted
+    print(f"⚙  {inserted} lignes insérées (scan_id {scan_id}) en {duration:.2f} secondes, soit {throughput:.0f} lignes/s.")
+    return scan_id
+
 # Fonction pour traiter un fichier d'entrée et insérer les données dans la base
-def process_file(input_file):
-    scan_id = get_next_scan_id()
-    if scan_id is None:
-        print("Erreur lors de la génération du scan_id.")
+def process_file(input_file, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Ingère tout un fichier de résultats, lu au fil de l'eau, voir insert_rows : fichier d'enregistrements
+    produit par capture.py, ou fichier texte (les captures Base64 d'un ancien fichier à 8 colonnes sont
+    extraites dans le répertoire des captures du scan).
+
+    Returns:
+        int: scan_id du scan inséré, ou None en cas d'erreur (rien n'est inséré).
+    """
+    captures = CaptureStore(captures_directory(input_file))
+    return insert_rows(iter_records(input_file, captures=captures), captures, iter_probe_details(input_file), batch_size)
+
+# Fonction pour déplacer les captures Base64 des anciennes lignes vers la table screenshots
+def migrate_legacy_screenshots(batch_size=DEFAULT_BATCH_SIZE):
+    connection = connect_db()
+    if connection is None:
         return
 
-    with open(input_file, 'r') as file:
-        for line in file:
-            # Supposons que le fichier ait un format spécifique : domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64
-            data = line.strip().split(',')
-            if len(data) == 8:
-                domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64 = data
-                insert_scan_result(scan_id, domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64)
-            else:
-                print(f"Ligne mal formatée: {line}")
+    migrated = 0
+    known_screenshots = set()
+    try:
+        ensure_schema(connection)
+        while True:
+            # Un lot par transaction : les lignes migrées n'ont plus de Base64 et ne sont plus sélectionnées
+            with connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT ctid, image_http_base64, image_https_base64
+                    FROM scan_results
+                    WHERE image_http_base64 IS NOT NULL OR image_https_base64 IS NOT NULL
+                    LIMIT %s
+                """, (batch_size,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                screenshots = {}
+                updates = []
+                for ctid, image_http_base64, image_https_base64 in rows:
+                    image_http_sha256, image_http = decode_screenshot(image_http_base64)
+                    image_https_sha256, image_https = decode_screenshot(image_https_base64)
+                    for sha256, content in ((image_http_sha256, image_http), (image_https_sha256, image_https)):
+                        if sha256:
+                            screenshots[sha256] = content
+                    updates.append((ctid, image_http_sha256, image_https_sha256))
+
+                store_screenshots(cursor, screenshots, known_screenshots)
+                execute_values(cursor, """
+                    UPDATE scan_results AS r
+                    SET image_http_sha256 = COALESCE(v.image_http_sha256, r.image_http_sha256),
+                        image_https_sha256 = COALESCE(v.image_https_sha256, r.image_https_sha256),
+                        image_http_base64 = NULL,
+                        image_https_base64 = NULL
+                    FROM (VALUES %s) AS v (row_ctid, image_http_sha256, image_https_sha256)
+                    WHERE r.ctid = v.row_ctid::tid
+                """, updates)
+                migrated += len(rows)
+                print(f"⚙  {migrated} lignes migrées vers le stockage des captures...")
+    except Exception as e:
+        print(f"Erreur lors de la migration des captures: {str(e)}")
+    finally:
+        connection.close()
 
 # Main function to handle argument parsing and file processing
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script de scan de sous-domaines avec insertion dans la base de données.")
-    parser.add_argument("input_file", help="Le chemin vers le fichier d'entrée contenant les résultats de scan.")
+    parser.add_argument("input_file", nargs="?", help="Le chemin vers le fichier d'entrée contenant les résultats de scan.")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Nombre de lignes envoyées par lot COPY.")
+    parser.add_argument("--migrate_images", action="store_true", help="Déplacer les captures Base64 des scans existants vers la table screenshots.")
     
     args = parser.parse_args()
 
+    if args.migrate_images:
+        migrate_legacy_screenshots(args.batch_size)
+
     # Traitement du fichier
-    process_file(args.input_file)
+    if args.input_file:
+        # Code de sortie non nul en cas d'échec, pour que main.py ne considère pas l'étape comme terminée
+        if process_file(args.input_file, args.batch_size) is None:
+            sys.exit(1)
+    elif not args.migrate_images:
+        parser.error("Le fichier d'entrée est requis.")
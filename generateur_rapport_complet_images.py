@@ -1,8 +1,67 @@
 import os
-import psycopg2
+import sys
+import base64
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pytz
 import argparse
+from database import connect_db
+from utils import positive_int
+from report_writer import HtmlReportWriter, ImageStore
+
+# Nombre de lignes dont les captures sont lues en une seule requête
+IMAGE_BATCH_SIZE = 200
+
+# Nombre de lignes par page lorsque le rapport est découpé par taille
+DEFAULT_PAGE_SIZE = 5000
+
+# Page d'un rapport découpé : lignes d'un scan (toutes celles d'un domaine, ou une tranche offset/limit)
+# content vaut "all" (lignes et suppressions), "current" (lignes du scan) ou "removed" (suppressions)
+ReportPage = namedtuple("ReportPage", "scan_id previous_scan_id number domain offset limit content label")
+
+# Fonction pour générer le rapport des scans enregistrés dans la base de données
+def generate_report(output_directory="rapport_scans", output_file_name=None, last=None, scan_id=None, external_images=False,
+                    split_by=None, page_size=DEFAULT_PAGE_SIZE, jobs=1):
+    """
+    Génère le rapport complet des scans enregistrés dans la base de données (paramètres de database.py).
+    Le rapport ne fait que lire la base : le schéma est installé par l'insertion des résultats (database.insert_rows).
+
+    Args:
+        output_directory (str): Répertoire de sortie du rapport.
+        output_file_name (str): Nom du fichier HTML du rapport.
+        last (int): Ne présenter que les N derniers scans (comparés à leur prédécesseur).
+        scan_id (int): Ne présenter que ce scan, comparé à son prédécesseur.
+        external_images (bool): Captures écrites dans un répertoire voisin du rapport.
+        split_by (str): Découpage en pages, "domain" ou "size" (voir generate_html_report).
+        page_size (int): Nombre de lignes par page avec split_by="size".
+        jobs (int): Nombre de processus générant les pages en parallèle.
+
+    Returns:
+        bool: True si le rapport a été généré (ou s'il n'y a aucun scan), False si la connexion a échoué.
+    """
+    # Connexion à la base de données (paramètres de database.py)
+    conn = connect_db()
+    if conn is None:
+        return False
+    try:
+        cur = conn.cursor()
+
+        # Sélection des scans à présenter, sans lire la table des résultats
+        scan_pairs = fetch_scan_pairs(cur, last, scan_id)
+        if not scan_pairs:
+            print("Aucun scan trouvé.")
+        else:
+            # Générer le rapport HTML
+            generate_html_report(
+                cur, scan_pairs, output_directory, output_file_name, external_images,
+                split_by=split_by, page_size=page_size, jobs=jobs
+            )
+        cur.close()
+    finally:
+        # Fermer la connexion à la base de données
+        conn.close()
+    return True
 
 # Fonction principale
 def main():
@@ -10,58 +69,195 @@ def main():
     parser = argparse.ArgumentParser(description="Générateur de rapport de scan")
     parser.add_argument("-o", "--output_directory", default="rapport_scans", help="Répertoire de sortie pour le rapport")
     parser.add_argument("-f", "--output_file", help="Nom du fichier de sortie (avec extension .html)")
+    parser.add_argument("--last", type=int, metavar="N", help="Ne présenter que les N derniers scans (comparés à leur prédécesseur)")
+    parser.add_argument("--scan_id", type=int, help="Ne présenter que ce scan, comparé à son prédécesseur")
+    parser.add_argument("--external_images", action="store_true", help="Écrire les captures dans un répertoire voisin du rapport (miniatures chargées à la demande) au lieu de les intégrer en Base64")
+    parser.add_argument("--split_by", choices=["domain", "size"], help="Découper le rapport en pages (une par domaine, ou de --page_size lignes) reliées par une page d'index")
+    parser.add_argument("--page_size", type=positive_int, default=DEFAULT_PAGE_SIZE, metavar="N", help="Nombre de lignes par page avec --split_by size")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Nombre de processus générant les pages en parallèle avec --split_by")
     args = parser.parse_args()
 
-    output_directory = args.output_directory
-    output_file_name = args.output_file
-
-    # Connexion à la base de données
-    conn = psycopg2.connect(
-        dbname="scans",         # Nom de votre base de données actuelle
-        user="scanner",         # Votre utilisateur PostgreSQL
-        password="password",    # Mot de passe PostgreSQL
-        host="localhost"
-    )
-    cur = conn.cursor()
-
-    # Récupération de tous les scans (sélection explicite des colonnes)
-    cur.execute("""
-        SELECT scan_id, domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64
-        FROM scan_results
-        ORDER BY scan_id DESC, scan_time DESC
-    """)
-    scans = cur.fetchall()
-
-    # Générer le rapport HTML
-    generate_html_report(scans, output_directory, output_file_name)
-
-    # Fermer la connexion à la base de données
-    cur.close()
-    conn.close()
-
-# Fonction pour générer le rapport HTML
-def generate_html_report(scans, output_directory, output_file_name):
-    # Convertir l'heure en heure de Montréal
-    montreal_tz = pytz.timezone('America/Montreal')
-    image_counter = 0  # Compteur pour les IDs uniques des images
+    if not generate_report(
+        args.output_directory, args.output_file, args.last, args.scan_id, args.external_images,
+        args.split_by, args.page_size, args.jobs
+    ):
+        sys.exit(1)
 
-    # Calculer les statistiques globales
-    total_scans = len(set(scan[0] for scan in scans))
-    total_subdomains = len(set(scan[2] for scan in scans))
-    total_domains = len(set(scan[1] for scan in scans))
+# Fonction pour choisir les scans à présenter
+def fetch_scan_pairs(cur, last=None, scan_id=None):
+    """
+    Renvoie la liste des scans à présenter, du plus récent au plus ancien, chacun avec son prédécesseur.
 
-    # Déterminer le titre du rapport et le nom du fichier
-    current_time = datetime.now(montreal_tz).strftime("%Y-%m-%d à %H:%M")
-    if output_file_name:
-        filename = output_file_name
-        title_text = os.path.splitext(output_file_name)[0]
-    else:
-        current_time_filename = datetime.now(montreal_tz).strftime("%Y-%m-%d-%H-%M")
-        filename = f"rapport_scans_{current_time_filename}.html"
-        title_text = f"Rapport de Scan du {current_time}"
+    Args:
+        cur: Curseur PostgreSQL.
+        last (int): Nombre de scans récents à présenter (tous si absent).
+        scan_id (int): Scan précis à présenter.
 
-    # Générer l'entête du rapport avec le bon design pour les statistiques
-    html = f"""
+    Returns:
+        list of tuples: (scan_id, previous_scan_id ou None).
+    """
+    query = "SELECT scan_id FROM scans WHERE subdomain_count > 0"
+    params = []
+    if scan_id is not None:
+        query += " AND scan_id <= %s"
+        params.append(scan_id)
+    query += " ORDER BY scan_id DESC"
+
+    # Un scan de plus que ceux présentés, pour connaître le prédécesseur du plus ancien
+    limit = 2 if scan_id is not None else (last + 1 if last else None)
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    cur.execute(query, params)
+    scan_ids = [row[0] for row in cur.fetchall()]
+    if scan_id is not None and (not scan_ids or scan_ids[0] != scan_id):
+        return []
+
+    displayed = scan_ids[:limit - 1] if limit else scan_ids
+    return [
+        (current_id, scan_ids[i + 1] if i + 1 < len(scan_ids) else None)
+        for i, current_id in enumerate(displayed)
+    ]
+
+# Jointure de chaque ligne avec la même ligne (domaine, sous-domaine) du scan précédent
+PREVIOUS_ROW_JOIN = """
+        LEFT JOIN LATERAL (
+            SELECT TRUE AS found, http_codes, ports, ip_address
+            FROM scan_results p
+            WHERE p.scan_id = %(previous)s AND p.domain = c.domain AND p.subdomain = c.subdomain
+            LIMIT 1
+        ) p ON TRUE
+"""
+
+# Fonction pour compter ajouts, modifications et suppressions d'un scan par rapport au précédent, côté SQL
+def fetch_scan_summary(cur, scan_id, previous_scan_id):
+    cur.execute(f"""
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE p.found IS NULL),
+               COUNT(*) FILTER (WHERE p.found AND (
+                   c.http_codes IS DISTINCT FROM p.http_codes
+                   OR c.ports IS DISTINCT FROM p.ports
+                   OR c.ip_address IS DISTINCT FROM p.ip_address
+               )),
+               (SELECT COUNT(DISTINCT (o.domain, o.subdomain)) FROM scan_results o
+                WHERE o.scan_id = %(previous)s AND NOT EXISTS (
+                    SELECT 1 FROM scan_results n
+                    WHERE n.scan_id = %(current)s AND n.domain = o.domain AND n.subdomain = o.subdomain
+                )),
+               MAX(c.scan_time)
+        FROM scan_results c
+        {PREVIOUS_ROW_JOIN}
+        WHERE c.scan_id = %(current)s
+    """, {"current": scan_id, "previous": previous_scan_id})
+    return cur.fetchone()
+
+# Fonction pour parcourir le résultat d'une requête par lots de IMAGE_BATCH_SIZE lignes, avec un curseur côté serveur
+# (curseur nommé) : seul le lot courant est en mémoire, et le curseur cur reste libre pour les autres requêtes
+def iter_batches(cur, name, query, params):
+    with cur.connection.cursor(name=name) as server_cur:
+        server_cur.execute(query, params)
+        while True:
+            batch = server_cur.fetchmany(IMAGE_BATCH_SIZE)
+            if not batch:
+                break
+            yield batch
+
+# Fonction pour lire les lignes d'un scan avec les valeurs du scan précédent (sans les captures), par lots
+# Les lignes peuvent être restreintes à un domaine et à une tranche (offset, limit) pour une page
+def fetch_scan_rows(cur, scan_id, previous_scan_id, domain=None, offset=None, limit=None):
+    domain_filter = "AND c.domain = %(domain)s" if domain is not None else ""
+    return iter_batches(cur, f"scan_rows_{scan_id}", f"""
+        SELECT c.domain, c.subdomain, c.http_codes, c.ports, c.ip_address, c.scan_time,
+               c.image_http_sha256, c.image_https_sha256,
+               c.image_http_base64 IS NOT NULL OR c.image_https_base64 IS NOT NULL,
+               COALESCE(p.found, FALSE), p.http_codes, p.ports, p.ip_address
+        FROM scan_results c
+        {PREVIOUS_ROW_JOIN}
+        WHERE c.scan_id = %(current)s {domain_filter}
+        ORDER BY c.scan_time DESC, c.domain, c.subdomain
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, {"current": scan_id, "previous": previous_scan_id, "domain": domain, "limit": limit, "offset": offset or 0})
+
+# Fonction pour lire les lignes du scan précédent absentes du scan courant, par lots
+def fetch_removed_rows(cur, scan_id, previous_scan_id, domain=None, offset=None, limit=None):
+    if previous_scan_id is None:
+        return []
+    domain_filter = "AND o.domain = %(domain)s" if domain is not None else ""
+    return iter_batches(cur, f"removed_rows_{scan_id}", f"""
+        SELECT DISTINCT ON (o.domain, o.subdomain) o.domain, o.subdomain, o.http_codes, o.ports, o.ip_address
+        FROM scan_results o
+        WHERE o.scan_id = %(previous)s {domain_filter} AND NOT EXISTS (
+            SELECT 1 FROM scan_results n
+            WHERE n.scan_id = %(current)s AND n.domain = o.domain AND n.subdomain = o.subdomain
+        )
+        ORDER BY o.domain, o.subdomain
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, {"current": scan_id, "previous": previous_scan_id, "domain": domain, "limit": limit, "offset": offset or 0})
+
+# Fonction pour découper un scan en pages
+def plan_scan_pages(cur, scan_id, previous_scan_id, split_by, page_size, row_count, deletions):
+    """
+    Args:
+        split_by (str): "domain" (une page par domaine, suppressions comprises) ou "size" (pages de page_size lignes,
+            puis pages de suppressions).
+        row_count (int): Nombre de lignes du scan.
+        deletions (int): Nombre de suppressions par rapport au scan précédent.
+
+    Returns:
+        list of ReportPage: Pages du scan, numérotées à partir de 1.
+    """
+    pages = []
+    if split_by == "domain":
+        cur.execute("""
+            SELECT domain FROM scan_results
+            WHERE scan_id = %(current)s OR scan_id = %(previous)s
+            GROUP BY domain ORDER BY domain
+        """, {"current": scan_id, "previous": previous_scan_id})
+        for (domain,) in cur.fetchall():
+            pages.append(ReportPage(scan_id, previous_scan_id, len(pages) + 1, domain, None, None, "all", domain))
+        return pages
+
+    for offset in range(0, row_count, page_size):
+        label = f"Lignes {offset + 1} à {min(offset + page_size, row_count)}"
+        pages.append(ReportPage(scan_id, previous_scan_id, len(pages) + 1, None, offset, page_size, "current", label))
+    for offset in range(0, deletions, page_size):
+        label = f"Suppressions {offset + 1} à {min(offset + page_size, deletions)}"
+        pages.append(ReportPage(scan_id, previous_scan_id, len(pages) + 1, None, offset, page_size, "removed", label))
+    return pages
+
+# Fonction pour nommer le fichier d'une page, à côté du fichier d'index
+def page_filename(report_filename, page):
+    return f"{os.path.splitext(report_filename)[0]}_scan{page.scan_id}_page{page.number}.html"
+
+# Fonction pour lire les captures d'un lot de lignes affichées
+def fetch_images(cur, scan_id, rows):
+    """
+    Returns:
+        dict: Clé (empreinte sha256) ou (sous-domaine, "http"/"https") pour les anciens scans -> contenu PNG.
+    """
+    images = {}
+    hashes = list({sha256 for row in rows for sha256 in (row[6], row[7]) if sha256})
+    if hashes:
+        cur.execute("SELECT sha256, content FROM screenshots WHERE sha256 = ANY(%s)", (hashes,))
+        for sha256, content in cur.fetchall():
+            images[sha256] = bytes(content)
+
+    # Anciens scans non migrés : captures en Base64 dans la ligne
+    legacy_subdomains = [row[1] for row in rows if row[8]]
+    if legacy_subdomains:
+        cur.execute("""
+            SELECT subdomain, image_http_base64, image_https_base64 FROM scan_results
+            WHERE scan_id = %s AND subdomain = ANY(%s)
+        """, (scan_id, legacy_subdomains))
+        for subdomain, image_http, image_https in cur.fetchall():
+            images[(subdomain, "http")] = base64.b64decode(image_http) if image_http else None
+            images[(subdomain, "https")] = base64.b64decode(image_https) if image_https else None
+    return images
+
+# Fonction pour générer le début commun des pages du rapport : styles, script, titre et légende
+def render_report_head(title_text):
+    return f"""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -156,6 +352,12 @@ def generate_html_report(scans, output_directory, output_file_name):
                 max-width: 100%;
                 height: auto;
             }}
+            .thumbnail {{
+                max-width: 320px;
+                max-height: 200px;
+                height: auto;
+                border: 1px solid #ddd;
+            }}
         </style>
         <script>
             function toggleImage(id) {{
@@ -179,93 +381,38 @@ def generate_html_report(scans, output_directory, output_file_name):
                 <td style="background-color: lightgray;">Déjà présent</td>
             </tr>
         </table>
-        <div class="stats">
-            <div class="stat-box">Total de Scans: {total_scans}</div>
-            <div class="stat-box">Total de Sous-domaines Scannés: {total_subdomains}</div>
-            <div class="stat-box">Total de Domaines Scannés: {total_domains}</div>
-        </div>
-    """
-
-    scan_data = {}
-    for scan in scans:
-        # Assurer que le déballage correspond au nombre de colonnes récupérées
-        scan_id, domain, subdomain, http_code, port, ip_address, scan_time, image_http, image_https = scan
-        if scan_id not in scan_data:
-            scan_data[scan_id] = []
-        scan_data[scan_id].append((domain, subdomain, http_code, port, ip_address, scan_time, image_http, image_https))
-
-    sorted_scan_ids = sorted(scan_data.keys(), reverse=True)
-    for i, scan_id in enumerate(sorted_scan_ids):
-        current_scan = scan_data[scan_id]
-        previous_scan = scan_data[sorted_scan_ids[i + 1]] if i + 1 < len(sorted_scan_ids) else []
-
-        # Initialisation des ajouts, modifications et suppressions pour chaque scan
-        additions = 0
-        modifications = 0
-        deletions = 0
-
-        # Compte des sous-domaines du scan actuel
-        current_subdomains_count = len(current_scan)
-
-        previous_scan_dict = {
-            (domain, subdomain): (http_code, port, ip_address, image_http, image_https)
-            for domain, subdomain, http_code, port, ip_address, scan_time, image_http, image_https in previous_scan
-        }
-
-        # Parcourir le scan actuel pour compter les ajouts et les modifications
-        current_scan_keys = set()
-        for domain, subdomain, http_code, port, ip_address, scan_time, image_http, image_https in current_scan:
-            key = (domain, subdomain)
-            current_scan_keys.add(key)
-            if key not in previous_scan_dict:
-                additions += 1
-            elif (
-                http_code != previous_scan_dict[key][0]
-                or port != previous_scan_dict[key][1]
-                or ip_address != previous_scan_dict[key][2]
-            ):
-                modifications += 1
+"""
+
+# Entête du tableau des résultats d'un scan
+RESULTS_TABLE_HEADER = """
+                <table>
+                    <tr>
+                        <th>Domaine</th>
+                        <th>Sous-domaine</th>
+                        <th>Code HTTP</th>
+                        <th>Port</th>
+                        <th>Adresse IP</th>
+                        <th>Heure du Scan</th>
+                        <th>Image HTTP</th>
+                        <th>Image HTTPS</th>
+                    </tr>
+            """
 
-        # Compter les suppressions en comparant avec le scan précédent
-        for domain, subdomain in previous_scan_dict:
-            if (domain, subdomain) not in current_scan_keys:
-                deletions += 1
+# Fonction pour écrire les lignes d'un scan dans le tableau, lot par lot (voir fetch_scan_rows) ; les captures de
+# chaque lot sont lues en une requête
+def write_scan_rows(writer, cur, scan_id, batches, montreal_tz, image_store=None):
+    image_counter = 0  # Compteur pour les IDs uniques des images
+    for batch in batches:
+        images = fetch_images(cur, scan_id, batch)
 
-        # Maintenant que les compteurs sont calculés, insérez-les dans le HTML
-        html += f"""
-        <div class="scan-result">
-            <h2>Rapport du Scan ID: {scan_id}</h2>
-            <h3>Date: {current_scan[0][5].astimezone(montreal_tz).strftime("%Y-%m-%d %H:%M:%S")}</h3>
-            <div class="stats">
-                <div class="stat-box">Sous-domaines: {current_subdomains_count}</div>
-                <div class="stat-box">Ajouts: {additions}</div>
-                <div class="stat-box">Modifications: {modifications}</div>
-                <div class="stat-box">Suppressions: {deletions}</div>
-            </div>
-            <h2>Résultats des Scans</h2>
-            <table>
-                <tr>
-                    <th>Domaine</th>
-                    <th>Sous-domaine</th>
-                    <th>Code HTTP</th>
-                    <th>Port</th>
-                    <th>Adresse IP</th>
-                    <th>Heure du Scan</th>
-                    <th>Image HTTP</th>
-                    <th>Image HTTPS</th>
-                </tr>
-        """
-
-        # Générer les lignes du tableau avec les classes appropriées
-        for domain, subdomain, http_code, port, ip_address, scan_time, image_http, image_https in current_scan:
-            key = (domain, subdomain)
-            if key not in previous_scan_dict:
+        for domain, subdomain, http_code, port, ip_address, scan_time, image_http_sha256, image_https_sha256, _, previous_found, prev_http_code, prev_port, prev_ip_address in batch:
+            if not previous_found:
                 # Ajouté
                 row_class = "added"
             elif (
-                http_code != previous_scan_dict[key][0]
-                or port != previous_scan_dict[key][1]
-                or ip_address != previous_scan_dict[key][2]
+                http_code != prev_http_code
+                or port != prev_port
+                or ip_address != prev_ip_address
             ):
                 # Modifié
                 row_class = "modified"
@@ -273,27 +420,34 @@ def generate_html_report(scans, output_directory, output_file_name):
                 # Inchangé
                 row_class = "unchanged"
 
+            image_http = images.get(image_http_sha256) or images.get((subdomain, "http"))
+            image_https = images.get(image_https_sha256) or images.get((subdomain, "https"))
+
             # Générer les boutons et images pour HTTP
-            if image_http:
+            if image_http and image_store:
+                image_http_html = image_store.render(image_http, "Image HTTP")
+            elif image_http:
                 image_counter += 1
-                img_http_id = f"img_http_{image_counter}"
+                img_http_id = f"img_http_{scan_id}_{image_counter}"
                 image_http_html = f"""
                 <button onclick="toggleImage('{img_http_id}')">Voir Image HTTP</button>
                 <div class="image-container">
-                    <img id="{img_http_id}" src="data:image/png;base64,{image_http}" style="display:none;"/>
+                    <img id="{img_http_id}" src="data:image/png;base64,{base64.b64encode(image_http).decode('ascii')}" style="display:none;"/>
                 </div>
                 """
             else:
                 image_http_html = "N/A"
 
             # Générer les boutons et images pour HTTPS
-            if image_https:
+            if image_https and image_store:
+                image_https_html = image_store.render(image_https, "Image HTTPS")
+            elif image_https:
                 image_counter += 1
-                img_https_id = f"img_https_{image_counter}"
+                img_https_id = f"img_https_{scan_id}_{image_counter}"
                 image_https_html = f"""
                 <button onclick="toggleImage('{img_https_id}')">Voir Image HTTPS</button>
                 <div class="image-container">
-                    <img id="{img_https_id}" src="data:image/png;base64,{image_https}" style="display:none;"/>
+                    <img id="{img_https_id}" src="data:image/png;base64,{base64.b64encode(image_https).decode('ascii')}" style="display:none;"/>
                 </div>
                 """
             else:
@@ -301,8 +455,6 @@ def generate_html_report(scans, output_directory, output_file_name):
 
             # Comparer les valeurs précédentes pour les modifications
             if row_class == "modified":
-                prev_http_code, prev_port, prev_ip_address, _, _ = previous_scan_dict[key]
-
                 http_code_display = f"{prev_http_code} &rarr; <span class='new-value'>{http_code}</span>" if http_code != prev_http_code else f"{http_code}"
                 port_display = f"{prev_port} &rarr; <span class='new-value'>{port}</span>" if port != prev_port else f"{port}"
                 ip_address_display = f"{prev_ip_address} &rarr; <span class='new-value'>{ip_address}</span>" if ip_address != prev_ip_address else f"{ip_address}"
@@ -311,7 +463,7 @@ def generate_html_report(scans, output_directory, output_file_name):
                 port_display = f"{port}"
                 ip_address_display = f"{ip_address}"
 
-            html += f"""
+            writer.write(f"""
             <tr class="{row_class}">
                 <td>{domain}</td>
                 <td>{subdomain}</td>
@@ -322,53 +474,193 @@ def generate_html_report(scans, output_directory, output_file_name):
                 <td>{image_http_html}</td>
                 <td>{image_https_html}</td>
             </tr>
-            """
+            """)
+
+# Fonction pour écrire les lignes du scan précédent absentes du scan courant, lot par lot (voir fetch_removed_rows)
+def write_removed_rows(writer, batches):
+    for domain, subdomain, prev_http_code, prev_port, prev_ip_address in (row for batch in batches for row in batch):
+        # Générer les images N/A pour les suppressions
+        image_http_html = "N/A"
+        image_https_html = "N/A"
+        writer.write(f"""
+        <tr class="removed">
+            <td>{domain}</td>
+            <td>{subdomain}</td>
+            <td>{prev_http_code}</td>
+            <td>{prev_port}</td>
+            <td>{prev_ip_address}</td>
+            <td></td>
+            <td>{image_http_html}</td>
+            <td>{image_https_html}</td>
+        </tr>
+        """)
+
+# Fonction pour générer une page d'un rapport découpé
+def generate_report_page(cur, page, output_directory, report_filename, title_text, external_images=False):
+    """
+    Écrit les lignes d'une page dans son propre fichier HTML, à côté de la page d'index.
 
-        # Ajouter les suppressions
-        for domain, subdomain in previous_scan_dict:
-            if (domain, subdomain) not in current_scan_keys:
-                # Suppression
-                prev_http_code, prev_port, prev_ip_address, prev_image_http, prev_image_https = previous_scan_dict[(domain, subdomain)]
-                # Générer les images N/A pour les suppressions
-                image_http_html = "N/A"
-                image_https_html = "N/A"
-                html += f"""
-                <tr class="removed">
-                    <td>{domain}</td>
-                    <td>{subdomain}</td>
-                    <td>{prev_http_code}</td>
-                    <td>{prev_port}</td>
-                    <td>{prev_ip_address}</td>
-                    <td></td>
-                    <td>{image_http_html}</td>
-                    <td>{image_https_html}</td>
-                </tr>
-                """
+    Returns:
+        str: Nom du fichier de la page.
+    """
+    montreal_tz = pytz.timezone('America/Montreal')
+    image_store = ImageStore(output_directory, report_filename) if external_images else None
+    filename = page_filename(report_filename, page)
 
-        html += """
-        </table>
-        </div>
-        """
+    with HtmlReportWriter(output_directory, filename) as writer:
+        writer.set_header(render_report_head(f"{title_text} - Scan {page.scan_id} - {page.label}"))
+        writer.write(f"""
+        <p><a href="{report_filename}">&larr; Retour à l'index</a></p>
+        <div class="scan-result">
+        """)
+        writer.write(RESULTS_TABLE_HEADER)
+
+        if page.content in ("all", "current"):
+            batches = fetch_scan_rows(cur, page.scan_id, page.previous_scan_id, page.domain, page.offset, page.limit)
+            write_scan_rows(writer, cur, page.scan_id, batches, montreal_tz, image_store)
+        if page.content in ("all", "removed"):
+            batches = fetch_removed_rows(cur, page.scan_id, page.previous_scan_id, page.domain, page.offset, page.limit)
+            write_removed_rows(writer, batches)
+
+        writer.write("""
+            </table>
+            </div>
+        </body>
+        </html>
+        """)
+    return filename
+
+# Fonction exécutée par chaque processus de génération parallèle : une connexion par page
+def generate_report_page_worker(page, output_directory, report_filename, title_text, external_images):
+    conn = connect_db()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            return generate_report_page(cur, page, output_directory, report_filename, title_text, external_images)
+    finally:
+        conn.close()
 
-    html += """
-    </body>
-    </html>
+# Fonction pour générer le rapport HTML
+def generate_html_report(cur, scan_pairs, output_directory, output_file_name, external_images=False,
+                         split_by=None, page_size=DEFAULT_PAGE_SIZE, jobs=1):
     """
+    Génère le rapport des scans présentés, chacun comparé à son prédécesseur.
 
-    # Créer le répertoire de sortie s'il n'existe pas
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    Args:
+        split_by (str): Sans valeur, tout le rapport tient dans une page. "domain" ou "size" : le fichier de sortie
+            devient une page d'index (statistiques globales et résumé de chaque scan) reliée aux pages des lignes.
+        page_size (int): Nombre de lignes par page avec split_by="size".
+        jobs (int): Nombre de processus générant les pages en parallèle.
+    """
+    # Convertir l'heure en heure de Montréal
+    montreal_tz = pytz.timezone('America/Montreal')
 
-    # Chemin complet du fichier de sortie
-    output_path = os.path.join(output_directory, filename)
+    # Calculer les statistiques globales sur les scans présentés
+    scan_ids = [scan_id for scan_id, _ in scan_pairs]
+    cur.execute("SELECT COUNT(DISTINCT subdomain), COUNT(DISTINCT domain) FROM scan_results WHERE scan_id = ANY(%s)", (scan_ids,))
+    total_scans = len(scan_ids)
+    total_subdomains, total_domains = cur.fetchone()
 
-    # Écrire le rapport HTML dans le fichier
-    with open(output_path, "w") as file:
-        file.write(html)
+    # Déterminer le titre du rapport et le nom du fichier
+    current_time = datetime.now(montreal_tz).strftime("%Y-%m-%d à %H:%M")
+    if output_file_name:
+        filename = output_file_name
+        title_text = os.path.splitext(output_file_name)[0]
+    else:
+        current_time_filename = datetime.now(montreal_tz).strftime("%Y-%m-%d-%H-%M")
+        filename = f"rapport_scans_{current_time_filename}.html"
+        title_text = f"Rapport de Scan du {current_time}"
+
+    # Les captures externes sont écrites dans un répertoire voisin du rapport, une seule fois par contenu
+    image_store = ImageStore(output_directory, filename) if external_images else None
+
+    # Générer l'entête du rapport avec le bon design pour les statistiques
+    header = render_report_head(title_text) + f"""
+        <div class="stats">
+            <div class="stat-box">Total de Scans: {total_scans}</div>
+            <div class="stat-box">Total de Sous-domaines Scannés: {total_subdomains}</div>
+            <div class="stat-box">Total de Domaines Scannés: {total_domains}</div>
+        </div>
+    """
+
+    # Le rapport est écrit au fil de l'eau : chaque scan et chaque ligne sont écrits dès qu'ils sont produits
+    pages = []
+    with HtmlReportWriter(output_directory, filename) as writer:
+        writer.set_header(header)
+
+        for scan_id, previous_scan_id in scan_pairs:
+            # Compteurs calculés par la base, par rapport au scan précédent
+            current_subdomains_count, additions, modifications, deletions, last_scan_time = fetch_scan_summary(cur, scan_id, previous_scan_id)
+
+            # Maintenant que les compteurs sont calculés, insérez-les dans le HTML
+            writer.write(f"""
+            <div class="scan-result">
+                <h2>Rapport du Scan ID: {scan_id}</h2>
+                <h3>Date: {last_scan_time.astimezone(montreal_tz).strftime("%Y-%m-%d %H:%M:%S")}</h3>
+                <div class="stats">
+                    <div class="stat-box">Sous-domaines: {current_subdomains_count}</div>
+                    <div class="stat-box">Ajouts: {additions}</div>
+                    <div class="stat-box">Modifications: {modifications}</div>
+                    <div class="stat-box">Suppressions: {deletions}</div>
+                </div>
+            """)
+
+            if split_by:
+                # Rapport découpé : l'index ne contient que les liens vers les pages du scan
+                scan_pages = plan_scan_pages(cur, scan_id, previous_scan_id, split_by, page_size, current_subdomains_count, deletions)
+                pages.extend(scan_pages)
+                writer.write("""
+                <h2>Pages</h2>
+                <ul>
+                """)
+                for page in scan_pages:
+                    writer.write(f"""
+                    <li><a href="{page_filename(filename, page)}">Page {page.number} : {page.label}</a></li>
+                    """)
+                writer.write("""
+                </ul>
+            </div>
+            """)
+                continue
+
+            # Générer les lignes du tableau avec les classes appropriées
+            writer.write("""
+                <h2>Résultats des Scans</h2>
+            """)
+            writer.write(RESULTS_TABLE_HEADER)
+            write_scan_rows(writer, cur, scan_id, fetch_scan_rows(cur, scan_id, previous_scan_id), montreal_tz, image_store)
+
+            # Ajouter les suppressions
+            write_removed_rows(writer, fetch_removed_rows(cur, scan_id, previous_scan_id))
+
+            writer.write("""
+            </table>
+            </div>
+            """)
+
+        writer.write("""
+        </body>
+        </html>
+        """)
+
+        # Les pages sont écrites avant que l'index ne soit publié, pour qu'aucun lien ne soit cassé
+        if pages and jobs > 1:
+            print(f"⚙  Génération de {len(pages)} pages avec {jobs} processus...")
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(generate_report_page_worker, page, output_directory, filename, title_text, external_images)
+                    for page in pages
+                ]
+                for future in futures:
+                    if future.result() is None:
+                        raise RuntimeError("Une page du rapport n'a pas pu être générée")
+        else:
+            for page in pages:
+                generate_report_page(cur, page, output_directory, filename, title_text, external_images)
 
     # Afficher un message avec le lien et le nom du fichier généré
-    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {output_path}")
+    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {writer.path}")
 
 if __name__ == "__main__":
     main()
-
@@ -1,69 +1,59 @@
-import os
 from datetime import datetime
 import pytz
 import argparse
+import itertools
+from report_writer import HtmlReportWriter
+from records import iter_records
 
-def read_scan_results(file_path):
+def iter_scan_results(file_path):
     """
-    Lit les résultats de scan à partir d'un fichier texte sans en-têtes.
+    Lit les résultats de scan à partir d'un fichier texte sans en-têtes ou d'un fichier d'enregistrements
+    (voir records.iter_records), un résultat à la fois.
     
     Args:
-        file_path (str): Chemin vers le fichier texte contenant les résultats de scan.
+        file_path (str): Chemin vers le fichier contenant les résultats de scan.
 
-    Returns:
-        list of tuples: Liste des résultats de scan sous forme de tuples.
+    Yields:
+        tuple: Résultat de scan (domain, subdomain, http_code, port, ip_address, scan_time).
     """
-    scans = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as txtfile:
-            for line in txtfile:
-                # Supposer que chaque ligne contient les 6 colonnes attendues
-                data = line.strip().split(',')
-                if len(data) != 6:
-                    print(f"Ligne mal formatée: {line}")
-                    continue
-                
-                try:
-                    # Extraire les données de chaque ligne sans se baser sur des en-têtes
-                    domain = data[0].strip()
-                    subdomain = data[1].strip()
-                    http_code = data[2].strip()  # Conserver les tirets dans les codes HTTP
-                    port = data[3].strip()  # Conserver les tirets dans les ports
-                    ip_address = data[4].strip()
-
-                    # Conversion de scan_time en objet datetime avec timezone UTC
-                    scan_time = datetime.strptime(data[5], "%Y-%m-%d %H:%M:%S")
-                    scan_time = pytz.utc.localize(scan_time)
-
-                    # Ajouter les résultats dans la liste sans validation
-                    scans.append((domain, subdomain, http_code, port, ip_address, scan_time))
-                except ValueError as ve:
-                    print(f"Erreur de format de la ligne {line}: {ve}")
+        # Les captures ne figurent pas dans ce rapport : elles ne sont jamais lues
+        for record in iter_records(file_path):
+            try:
+                # Conversion de scan_time en objet datetime avec timezone UTC
+                scan_time = datetime.strptime(record.scan_time, "%Y-%m-%d %H:%M:%S")
+                scan_time = pytz.utc.localize(scan_time)
+
+                # Renvoyer le résultat sans validation
+                yield (record.domain, record.subdomain, record.http_codes, record.ports, record.ip_address, scan_time)
+            except ValueError as ve:
+                print(f"Erreur de format de la ligne {record.domain},{record.subdomain}: {ve}")
     except FileNotFoundError:
         print(f"Fichier non trouvé : {file_path}")
     except Exception as e:
         print(f"Erreur lors de la lecture du fichier : {str(e)}")
-    
-    return scans
 
 def generate_html_report(scans, output_dir="rapport_scans"):
     """
-    Génère un rapport HTML à partir des résultats de scan.
+    Génère un rapport HTML à partir des résultats de scan, en écrivant chaque ligne dès qu'elle est produite.
 
     Args:
-        scans (list of tuples): Liste des résultats de scan.
+        scans (iterable of tuples): Résultats de scan (liste ou itérateur, parcouru une seule fois).
         output_dir (str): Répertoire où le rapport sera enregistré.
+
+    Returns:
+        str: Chemin du rapport généré.
     """
     # Convertir l'heure en heure de Montréal
     montreal_tz = pytz.timezone('America/Montreal')
 
-    # Calculer les statistiques globales
-    total_scans = len(set([scan[0] for scan in scans]))
-    total_subdomains = len(set([scan[1] for scan in scans]))
-    total_domains = len(set([scan[0] for scan in scans]))
+    # Générer le nom de fichier avec la date et l'heure actuelles
+    current_time = datetime.now(montreal_tz).strftime("%Y-%m-%d-%H-%M")
+    filename = f"rapport_scans_{current_time}.html"
 
-    # Générer l'entête du rapport avec le bon design pour les statistiques
-    html = f"""
+    # Générer l'entête du rapport avec le bon design pour les statistiques (placée en tête du fichier une fois les statistiques connues)
+    def render_header(total_scans, total_subdomains, total_domains):
+        return f"""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -134,12 +124,19 @@ def generate_html_report(scans, output_dir="rapport_scans"):
             </tr>
     """
 
-    # Ajouter les lignes du tableau
-    for scan in scans:
-        domain, subdomain, http_code, port, ip_address, scan_time = scan
-        scan_time_local = scan_time.astimezone(montreal_tz).strftime("%Y-%m-%d %H:%M:%S")
+    # Statistiques globales, calculées pendant l'écriture des lignes
+    domains = set()
+    subdomains = set()
 
-        html += f"""
+    with HtmlReportWriter(output_dir, filename) as writer:
+        # Ajouter les lignes du tableau
+        for scan in scans:
+            domain, subdomain, http_code, port, ip_address, scan_time = scan
+            scan_time_local = scan_time.astimezone(montreal_tz).strftime("%Y-%m-%d %H:%M:%S")
+            domains.add(domain)
+            subdomains.add(subdomain)
+
+            writer.write(f"""
             <tr>
                 <td>{domain}</td>
                 <td>{subdomain}</td>
@@ -148,29 +145,40 @@ def generate_html_report(scans, output_dir="rapport_scans"):
                 <td>{ip_address}</td>
                 <td>{scan_time_local}</td>
             </tr>
-        """
+        """)
 
-    # Clôturer le tableau et le corps du HTML
-    html += """
+        # Clôturer le tableau et le corps du HTML
+        writer.write("""
         </table>
     </body>
     </html>
-    """
+    """)
 
-    # Créer le répertoire de sortie s'il n'existe pas
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+        writer.set_header(render_header(len(domains), len(subdomains), len(domains)))
 
-    # Générer le nom de fichier avec la date et l'heure actuelles
-    current_time = datetime.now(montreal_tz).strftime("%Y-%m-%d-%H-%M")
-    filename = os.path.join(output_dir, f"rapport_scans_{current_time}.html")
+    # Afficher un message avec le lien et le nom du fichier généré
+    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {writer.path}")
+    return writer.path
+
+def process_file(input_file, output_dir="rapport_scans"):
+    """
+    Génère le rapport HTML d'un fichier de résultats, lu au fil de la génération.
 
-    # Écrire le rapport HTML dans le fichier
-    with open(filename, "w", encoding="utf-8") as file:
-        file.write(html)
+    Args:
+        input_file (str): Chemin vers le fichier texte sans en-têtes contenant les résultats de scan.
+        output_dir (str): Répertoire où le rapport sera enregistré.
 
-    # Afficher un message avec le lien et le nom du fichier généré
-    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {filename}")
+    Returns:
+        str: Chemin du rapport généré, ou None si le fichier ne contient aucun scan.
+    """
+    scans = iter_scan_results(input_file)
+    first_scan = next(scans, None)
+    if first_scan is None:
+        print("Aucun scan trouvé ou erreur lors de la lecture du fichier.")
+        return None
+
+    # Générer le rapport HTML
+    return generate_html_report(itertools.chain([first_scan], scans), output_dir)
 
 def main():
     """
@@ -182,14 +190,7 @@ def main():
 
     args = parser.parse_args()
 
-    # Lire les résultats de scan depuis le fichier texte
-    scans = read_scan_results(args.input_file)
-    if not scans:
-        print("Aucun scan trouvé ou erreur lors de la lecture du fichier.")
-        return
-
-    # Générer le rapport HTML
-    generate_html_report(scans, args.output_dir)
+    process_file(args.input_file, args.output_dir)
 
 if __name__ == "__main__":
     main()
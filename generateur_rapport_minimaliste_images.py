@@ -1,7 +1,10 @@
 import os
+import base64
 from datetime import datetime
 import pytz
 import argparse
+from report_writer import HtmlReportWriter, ImageStore
+from records import CaptureStore, iter_records, captures_directory
 
 # Fonction pour générer le nom du fichier rapport
 def generate_report_filename():
@@ -15,36 +18,35 @@ def create_directory_if_not_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-# Fonction pour lire le fichier .txt avec les sous-domaines
-def read_input_file(input_file):
-    entries = []
-    with open(input_file, 'r') as file:
-        for line in file:
-            # Chaque ligne est supposée avoir la structure: domain, subdomain, http_codes, ports, ip_address, scan_time, image_http_base64, image_https_base64
-            parts = line.strip().split(',')
-            if len(parts) == 8:
-                entries.append({
-                    'domain': parts[0],
-                    'subdomain': parts[1],
-                    'http_codes': parts[2],
-                    'ports': parts[3],
-                    'ip_address': parts[4],
-                    'scan_time': parts[5],
-                    'image_http': parts[6],  # image_http_base64
-                    'image_https': parts[7]  # image_https_base64
-                })
-            else:
-                print(f"Problème avec la ligne : {line.strip()}")  # Debug si la ligne est incorrecte
-    return entries
-
-# Fonction pour générer le rapport HTML
-def generate_html_report(entries, output_directory, output_file_name):
+# Fonction pour convertir des enregistrements (records.ScanRecord) en entrées du rapport
+# Les captures sont lues dans captures (CaptureStore) au fil de la génération
+def iter_entries(records, captures):
+    for record in records:
+        yield {
+            'domain': record.domain,
+            'subdomain': record.subdomain,
+            'http_codes': record.http_codes,
+            'ports': record.ports,
+            'ip_address': record.ip_address,
+            'scan_time': record.scan_time,
+            'image_http': captures.get(record.image_http),  # contenu PNG ou None
+            'image_https': captures.get(record.image_https)  # contenu PNG ou None
+        }
+
+# Fonction pour lire le fichier de résultats (enregistrements de capture.py, ou ancien fichier .txt à 8 colonnes), une entrée à la fois
+def iter_input_file(input_file):
+    captures = CaptureStore(captures_directory(input_file))
+    return iter_entries(iter_records(input_file, captures=captures), captures)
+
+# Fonction pour générer le rapport HTML et renvoyer son chemin
+# Les entrées (liste ou itérateur, voir iter_entries) ne sont parcourues qu'une fois et chaque ligne est écrite dès qu'elle est produite
+def generate_html_report(entries, output_directory, output_file_name, external_images=False):
     montreal_tz = pytz.timezone('America/Montreal')
     image_counter = 0  # Compteur pour les IDs uniques des images
 
-    total_scans = len(set(entry['scan_time'] for entry in entries))
-    total_subdomains = len(set(entry['subdomain'] for entry in entries))
-    total_domains = len(set(entry['domain'] for entry in entries))
+    scan_times = set()
+    subdomains = set()
+    domains = set()
 
     # Prendre l'heure actuelle pour afficher dans le titre
     current_time = datetime.now(montreal_tz).strftime("%Y-%m-%d à %H:%M")
@@ -57,8 +59,12 @@ def generate_html_report(entries, output_directory, output_file_name):
         filename = generate_report_filename()
         title_text = f"Rapport de Scan du {current_time}"
 
-    # Générer l'entête du rapport avec la date et l'heure
-    html = f"""
+    # Les captures externes sont écrites dans un répertoire voisin du rapport, une seule fois par contenu
+    image_store = ImageStore(output_directory, filename) if external_images else None
+
+    # Générer l'entête du rapport avec la date et l'heure (placée en tête du fichier une fois les statistiques connues)
+    def render_header(total_scans, total_subdomains, total_domains):
+        return f"""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -122,6 +128,11 @@ def generate_html_report(entries, output_directory, output_file_name):
                 width: auto;
                 height: auto;
             }}
+            .thumbnail {{
+                max-width: 320px;
+                max-height: 200px;
+                border: 1px solid #ddd;
+            }}
         </style>
         <script>
             function toggleImage(id) {{
@@ -154,68 +165,75 @@ def generate_html_report(entries, output_directory, output_file_name):
             </tr>
     """
 
-    for entry in entries:
-        image_counter += 1
-        img_http_id = f"img_http_{image_counter}"
-        img_https_id = f"img_https_{image_counter + 1}"
+    with HtmlReportWriter(output_directory, filename) as writer:
+        for entry in entries:
+            scan_times.add(entry['scan_time'])
+            subdomains.add(entry['subdomain'])
+            domains.add(entry['domain'])
 
-        image_http_html = f"""
-        <button onclick="toggleImage('{img_http_id}')">Voir Image HTTP</button>
-        <div class="image-container">
-            <img id="{img_http_id}" src="data:image/png;base64,{entry['image_http']}" style="display:none;"/>
-        </div>
-        """ if entry['image_http'] else "N/A"
+            image_counter += 1
+            img_http_id = f"img_http_{image_counter}"
+            img_https_id = f"img_https_{image_counter + 1}"
 
-        image_https_html = f"""
-        <button onclick="toggleImage('{img_https_id}')">Voir Image HTTPS</button>
-        <div class="image-container">
-            <img id="{img_https_id}" src="data:image/png;base64,{entry['image_https']}" style="display:none;"/>
-        </div>
-        """ if entry['image_https'] else "N/A"
-
-        html += f"""
-        <tr>
-            <td>{entry['domain']}</td>
-            <td>{entry['subdomain']}</td>
-            <td>{entry['http_codes']}</td>
-            <td>{entry['ports']}</td>
-            <td>{entry['ip_address']}</td>
-            <td>{entry['scan_time']}</td>
-            <td>{image_http_html}</td>
-            <td>{image_https_html}</td>
-        </tr>
-        """
-
-    html += """
+            if image_store:
+                image_http_html = image_store.render(entry['image_http'], "Image HTTP") if entry['image_http'] else "N/A"
+                image_https_html = image_store.render(entry['image_https'], "Image HTTPS") if entry['image_https'] else "N/A"
+            else:
+                image_http_html = f"""
+                <button onclick="toggleImage('{img_http_id}')">Voir Image HTTP</button>
+                <div class="image-container">
+                    <img id="{img_http_id}" src="data:image/png;base64,{base64.b64encode(entry['image_http']).decode('ascii')}" style="display:none;"/>
+                </div>
+                """ if entry['image_http'] else "N/A"
+
+                image_https_html = f"""
+                <button onclick="toggleImage('{img_https_id}')">Voir Image HTTPS</button>
+                <div class="image-container">
+                    <img id="{img_https_id}" src="data:image/png;base64,{base64.b64encode(entry['image_https']).decode('ascii')}" style="display:none;"/>
+                </div>
+                """ if entry['image_https'] else "N/A"
+
+            writer.write(f"""
+            <tr>
+                <td>{entry['domain']}</td>
+                <td>{entry['subdomain']}</td>
+                <td>{entry['http_codes']}</td>
+                <td>{entry['ports']}</td>
+                <td>{entry['ip_address']}</td>
+                <td>{entry['scan_time']}</td>
+                <td>{image_http_html}</td>
+                <td>{image_https_html}</td>
+            </tr>
+            """)
+
+        writer.write("""
         </table>
     </body>
     </html>
-    """
+    """)
 
-    # Créer le répertoire de sortie s'il n'existe pas
-    create_directory_if_not_exists(output_directory)
+        # L'entête est écrite avant les lignes lors de la fermeture du rapport
+        writer.set_header(render_header(len(scan_times), len(subdomains), len(domains)))
 
-    # Écrire le rapport HTML dans le fichier
-    output_path = os.path.join(output_directory, filename)
-    with open(output_path, "w") as file:
-        file.write(html)
+    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {writer.path}")
+    return writer.path
 
-    print(f"Génération terminée ! Le rapport a été enregistré sous le nom : {output_path}")
+# Fonction pour générer le rapport d'un fichier de résultats, lu au fil de la génération
+def process_file(input_file, output_directory="rapport_minimaliste_scans", output_file_name=None, external_images=False):
+    return generate_html_report(iter_input_file(input_file), output_directory, output_file_name, external_images)
 
 # Point d'entrée principal
 def main():
     # Utilisation d'argparse pour passer le fichier en paramètre
     parser = argparse.ArgumentParser(description="Générateur de rapport minimaliste")
-    parser.add_argument("input_file", help="Chemin du fichier .txt contenant les données des sous-domaines")
+    parser.add_argument("input_file", help="Chemin du fichier de résultats (enregistrements produits par capture.py, ou fichier .txt à 8 colonnes)")
     parser.add_argument("-o", "--output_directory", default="rapport_minimaliste_scans", help="Répertoire de sortie pour le rapport")
     parser.add_argument("-f", "--output_file", help="Nom du fichier de sortie (avec extension .html)")
+    parser.add_argument("--external_images", action="store_true", help="Écrire les captures dans un répertoire voisin du rapport (miniatures chargées à la demande) au lieu de les intégrer en Base64")
     args = parser.parse_args()
 
-    # Lire les données du fichier .txt
-    entries = read_input_file(args.input_file)
-
     # Générer le rapport minimaliste
-    generate_html_report(entries, args.output_directory, args.output_file)
+    process_file(args.input_file, args.output_directory, args.output_file, args.external_images)
 
 if __name__ == "__main__":
     main()
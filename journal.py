@@ -0,0 +1,146 @@
+import os
+import time
+import sqlite3
+from records import encode_record, decode_record
+
+# Nombre de résultats écrits entre deux points de reprise
+CHECKPOINT_INTERVAL = 200
+
+class ScanJournal:
+    """
+    Journal persistant d'un scan (fichier SQLite) : il enregistre les domaines énumérés, les sous-domaines
+    sondés et capturés ainsi que les étapes terminées, pour reprendre un scan interrompu sans refaire le
+    travail déjà fait (option --resume de main.py).
+
+    Les résultats des sondes sont écrits dans les fichiers texte du scan ; le journal mémorise, à chaque
+    point de reprise (checkpoint), la taille de ces fichiers en même temps que les sous-domaines déjà
+    sondés. À la reprise, les fichiers sont ramenés à cette taille : les lignes écrites après le dernier
+    point de reprise sont retirées et les sous-domaines correspondants sondés à nouveau, sans doublon.
+
+    Args:
+        path (str): Chemin du fichier SQLite du journal (créé s'il n'existe pas).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS stages (name TEXT PRIMARY KEY, done_at REAL);
+            CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, enumerated INTEGER DEFAULT 0, done INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS subdomains (domain TEXT, subdomain TEXT, PRIMARY KEY (domain, subdomain));
+            CREATE TABLE IF NOT EXISTS probes (domain TEXT, subdomain TEXT, PRIMARY KEY (domain, subdomain));
+            CREATE TABLE IF NOT EXISTS captures (domain TEXT, subdomain TEXT, line TEXT, PRIMARY KEY (domain, subdomain));
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER);
+        """)
+        self.connection.commit()
+
+    def get(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.connection.commit()
+
+    # Étapes du pipeline (sondes, captures, base de données, rapports, upload)
+    def stage_done(self, name):
+        return self.connection.execute("SELECT 1 FROM stages WHERE name = ?", (name,)).fetchone() is not None
+
+    def mark_stage(self, name):
+        self.connection.execute("INSERT OR REPLACE INTO stages (name, done_at) VALUES (?, ?)", (name, time.time()))
+        self.connection.commit()
+
+    # Domaines : énumération terminée, puis sondes terminées
+    def done_domains(self):
+        return {row[0] for row in self.connection.execute("SELECT domain FROM domains WHERE done = 1")}
+
+    def enumerated(self, domain):
+        row = self.connection.execute("SELECT enumerated FROM domains WHERE domain = ?", (domain,)).fetchone()
+        return bool(row and row[0])
+
+    def subdomains(self, domain):
+        return [row[0] for row in self.connection.execute("SELECT subdomain FROM subdomains WHERE domain = ?", (domain,))]
+
+    def add_subdomain(self, domain, subdomain):
+        self.connection.execute("INSERT OR IGNORE INTO subdomains (domain, subdomain) VALUES (?, ?)", (domain, subdomain))
+
+    def mark_enumerated(self, domain):
+        self.connection.execute(
+            "INSERT INTO domains (domain, enumerated) VALUES (?, 1) ON CONFLICT (domain) DO UPDATE SET enumerated = 1",
+            (domain,)
+        )
+        self.connection.commit()
+
+    # Sous-domaines sondés : validés avec le point de reprise qui suit l'écriture de leur résultat
+    def probed_subdomains(self, domain):
+        return {row[0] for row in self.connection.execute("SELECT subdomain FROM probes WHERE domain = ?", (domain,))}
+
+    # Sous-domaines capturés : l'enregistrement (empreintes des captures comprises, voir records.ScanRecord)
+    # est conservé jusqu'à la fin de l'étape, sérialisé comme dans le fichier d'enregistrements (records.encode_record)
+    def captured_record(self, domain, subdomain):
+        row = self.connection.execute(
+            "SELECT line FROM captures WHERE domain = ? AND subdomain = ?", (domain, subdomain)
+        ).fetchone()
+        # Une ligne illisible (journal d'une version antérieure) fait refaire la capture
+        return decode_record(row[0]) if row else None
+
+    def captured_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+
+    def add_capture(self, record):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO captures (domain, subdomain, line) VALUES (?, ?, ?)",
+            (record.domain, record.subdomain, encode_record(record))
+        )
+
+    def clear_captures(self):
+        self.connection.execute("DELETE FROM captures")
+        self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def checkpoint(self, files, probes=(), domains=()):
+        """
+        Point de reprise : écrit les fichiers sur disque, enregistre leur taille et valide dans la même
+        transaction les sous-domaines sondés et les domaines terminés depuis le point de reprise précédent.
+
+        Args:
+            files (list): Fichiers ouverts dont le contenu doit être durable.
+            probes (iterable): Couples (domaine, sous-domaine) dont le résultat est écrit dans les fichiers.
+            domains (iterable): Domaines dont tous les sous-domaines sont sondés.
+        """
+        self.connection.executemany("INSERT OR IGNORE INTO probes (domain, subdomain) VALUES (?, ?)", probes)
+        self.connection.executemany(
+            "INSERT INTO domains (domain, done) VALUES (?, 1) ON CONFLICT (domain) DO UPDATE SET done = 1",
+            ((domain,) for domain in domains)
+        )
+        for file in files:
+            file.flush()
+            os.fsync(file.fileno())
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size) VALUES (?, ?)", (os.path.abspath(file.name), os.fstat(file.fileno()).st_size)
+            )
+        self.connection.commit()
+
+    def restore_files(self):
+        """
+        Ramène les fichiers de résultats à leur taille au dernier point de reprise.
+
+        Returns:
+            int: Nombre d'octets retirés (résultats écrits après le dernier point de reprise).
+        """
+        removed = 0
+        for path, size in self.connection.execute("SELECT path, size FROM files").fetchall():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                removed += os.path.getsize(path) - size
+                with open(path, "r+b") as file:
+                    file.truncate(size)
+        return removed
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -1,12 +1,24 @@
 import subprocess
+import shutil
 import argparse
 import time
 from datetime import datetime
-from tools import collect_subdomains
-from results import filter_and_write_results
-from utils import print_message
+from tools import stream_subdomains, EnumerationCache, DEFAULT_ENUMERATION_CACHE_TTL
+from results import filter_and_write_results, ResultFiles, result_file_names
+from records import CaptureStore, iter_records, record_file_name, captures_directory
+import capture
+import database
+import generateur_rapport_minimaliste
+import generateur_rapport_minimaliste_images
+import generateur_rapport_complet_images
+from journal import ScanJournal
+from network import HttpProber
+from scheduler import Scheduler, DEFAULT_LIMITS, DEFAULT_RATES
+from resolver import ResolverStage, make_resolver
+from utils import print_message, positive_int
 import os
-import concurrent.futures
+import json
+import asyncio
 
 def process_directory(directory):
     """
@@ -29,19 +41,104 @@ def process_directory(directory):
 
     return domains
 
-def process_domain(domain, tools, output_file):
+async def journal_subdomains(subdomains, domain, journal):
+    """
+    Enregistre dans le journal les sous-domaines énumérés et ne renvoie que ceux qui n'ont pas déjà été sondés.
+
+    Args:
+        subdomains (async iterable): Flux des sous-domaines émis par les outils (voir tools.stream_subdomains).
+        domain (str): Le domaine énuméré.
+        journal (ScanJournal): Journal du scan.
+    """
+    probed = journal.probed_subdomains(domain)
+    async for subdomain in subdomains:
+        journal.add_subdomain(domain, subdomain)
+        if subdomain not in probed:
+            yield subdomain
+    journal.mark_enumerated(domain)
+
+async def process_domain(domain, tools, output_file, scheduler, prober, journal=None, enumeration_cache=None):
     """
     Fonction pour traiter un seul domaine (collecte des sous-domaines et écriture des résultats).
     
     Args:
         domain (str): Le domaine à traiter.
         tools (dict): Dictionnaire des outils de collecte de sous-domaines.
-        output_file (str): Fichier de sortie pour enregistrer les résultats.
+        output_file (ResultFiles): Fichiers de résultats partagés par tous les domaines.
+        scheduler (Scheduler): Ordonnanceur partagé par tous les domaines.
+        prober (HttpProber): Sondeur HTTP partagé par tous les domaines.
+        journal (ScanJournal): Journal du scan, pour ne pas refaire l'énumération ni les sondes déjà faites.
+        enumeration_cache (EnumerationCache): Cache de l'énumération d'un scan à l'autre.
     """
     print(f"⚙  Traitement de {domain}...")
-    subdomains = collect_subdomains(domain, tools)
-    filter_and_write_results(subdomains, domain, output_file)
-    print(f"⚙  Résultats pour {domain} enregistrés dans {output_file}.")
+    if journal and journal.enumerated(domain):
+        # Énumération terminée lors d'une exécution précédente : seuls les sous-domaines non sondés restent à faire
+        probed = journal.probed_subdomains(domain)
+        subdomains = [subdomain for subdomain in journal.subdomains(domain) if subdomain not in probed]
+        print(f"⚙  Reprise de {domain} : {len(probed)} sous-domaines déjà sondés, {len(subdomains)} restants.")
+    else:
+        # Les sous-domaines sont sondés dès qu'un outil les émet, sans attendre la fin de l'énumération
+        subdomains = stream_subdomains(domain, tools, scheduler, enumeration_cache)
+        if journal:
+            subdomains = journal_subdomains(subdomains, domain, journal)
+    await filter_and_write_results(subdomains, domain, output_file, prober)
+    print(f"⚙  Résultats pour {domain} enregistrés dans {output_file.output_file}.")
+
+async def run_pipeline(domains, tools, output_file, scheduler, resolver=None, resolve_first=False, probe_method="get",
+                       adaptive_timeouts=True, journal=None, enumeration_cache=None):
+    """
+    Traite tous les domaines dans une seule boucle asyncio. Les étapes des différents
+    domaines se chevauchent, dans les limites de concurrence de l'ordonnanceur.
+
+    Args:
+        domains (list): Domaines à traiter.
+        tools (dict): Dictionnaire des outils de collecte de sous-domaines.
+        output_file (str): Fichier de sortie pour enregistrer les résultats.
+        scheduler (Scheduler): Ordonnanceur du pipeline.
+        resolver (ResolverStage): Étape de résolution DNS partagée par tous les domaines.
+        resolve_first (bool): Déclarer invalides les noms inexistants sans sonde HTTP.
+        probe_method (str): Méthode des sondes HTTP, "get" ou "head" (voir HttpProber).
+        adaptive_timeouts (bool): Vérification TCP préalable et délais déduits des latences observées.
+        journal (ScanJournal): Journal du scan : les domaines terminés lors d'une exécution précédente sont ignorés.
+        enumeration_cache (EnumerationCache): Cache de l'énumération : les outils dont le résultat est récent ne sont pas relancés.
+
+    Returns:
+        bool: True si tous les domaines ont été traités sans erreur.
+    """
+    if journal:
+        done_domains = journal.done_domains()
+        if done_domains:
+            print(f"⚙  Reprise : {len(done_domains)} domaines déjà traités.")
+        domains = [domain for domain in domains if domain not in done_domains]
+
+    async def run_domain(domain, prober, result_files):
+        try:
+            await process_domain(domain, tools, result_files, scheduler, prober, journal, enumeration_cache)
+        except Exception as exc:
+            print(f"⚠  Erreur pour le domaine {domain} : {exc}")
+            return False
+        else:
+            print(f"⚙  Le traitement de {domain} est terminé.")
+            return True
+
+    # Les fichiers de résultats sont partagés par tous les domaines
+    with ResultFiles(output_file, journal) as result_files:
+        async with HttpProber(
+            scheduler, resolver=resolver, resolve_first=resolve_first,
+            probe_method=probe_method, adaptive_timeouts=adaptive_timeouts
+        ) as prober:
+            succeeded = await asyncio.gather(*(run_domain(domain, prober, result_files) for domain in domains))
+
+    if enumeration_cache:
+        print(f"⚙  Cache de l'énumération : {enumeration_cache.hits} énumérations réutilisées, {enumeration_cache.misses} exécutées.")
+    if prober.wildcard_dropped:
+        print(f"⚙  {prober.wildcard_dropped} sous-domaines ignorés car résolus uniquement par une zone wildcard.")
+    if resolve_first:
+        print(f"⚙  {prober.dead_skipped} sous-domaines inexistants (DNS) déclarés invalides, {prober.probes_skipped} sondes HTTP évitées.")
+    print(f"⚙  Sondes HTTP : {prober.requests_sent} requêtes ({probe_method.upper()}), {prober.bytes_received / 1e6:.2f} Mo reçus.")
+    if adaptive_timeouts:
+        print(f"⚙  {prober.closed_ports} sondes HTTP évitées car le port était fermé ou filtré.")
+    return all(succeeded)
 
 def main():
     # Message général d'exécution
@@ -84,10 +181,116 @@ def main():
         "--s3_url", help="URL S3 complète pour uploader le rapport (ex: s3://bucket/path/to/report.html)"
     )
 
+    # Captures écrites à côté du rapport au lieu d'être intégrées en Base64
+    parser.add_argument(
+        "--external_images", action="store_true",
+        help="Écrire les captures dans un répertoire voisin du rapport (miniatures chargées à la demande) au lieu de les intégrer au HTML"
+    )
+
+    # Découpage du rapport complet en pages reliées par une page d'index
+    parser.add_argument(
+        "--split_by", choices=["domain", "size"],
+        help="Découper le rapport complet en pages (une par domaine, ou de --page_size lignes) reliées par une page d'index"
+    )
+    parser.add_argument(
+        "--page_size", type=positive_int, metavar="N",
+        help="Nombre de lignes par page du rapport complet avec --split_by size"
+    )
+
+    # Limites de concurrence par étape du pipeline
+    parser.add_argument(
+        "--max_enumeration", type=int, default=DEFAULT_LIMITS["enumeration"], metavar="N",
+        help="Nombre maximal d'outils d'énumération exécutés simultanément"
+    )
+    parser.add_argument(
+        "--max_http", type=int, default=DEFAULT_LIMITS["http"], metavar="N",
+        help="Nombre maximal de sondes HTTP simultanées"
+    )
+    parser.add_argument(
+        "--max_dns", type=int, default=DEFAULT_LIMITS["dns"], metavar="N",
+        help="Nombre maximal de résolutions DNS simultanées"
+    )
+    parser.add_argument(
+        "--max_captures", type=int, default=DEFAULT_LIMITS["capture"], metavar="N",
+        help="Nombre maximal de captures d'écran simultanées"
+    )
+
+    # Moteur de capture d'écran
+    parser.add_argument(
+        "--capture_engine", choices=["aquatone", "aquatone_single", "browser"], default="aquatone",
+        help="Moteur de capture : Aquatone par lots de cibles, un processus Aquatone par capture, ou un pool de navigateurs persistants (Playwright)"
+    )
+    parser.add_argument(
+        "--capture_cache_ttl", type=float, default=24, metavar="HEURES",
+        help="Durée pendant laquelle la capture d'une page inchangée (même empreinte) est réutilisée ; 0 pour désactiver le cache"
+    )
+
+    # Résolveur DNS utilisé par l'étape de résolution
+    parser.add_argument(
+        "--resolver", choices=["dns", "system"], default="dns",
+        help="Résolveur DNS : requêtes UDP directes (dns) ou résolveur du système (system)"
+    )
+    parser.add_argument(
+        "--nameservers", metavar="IP[,IP...]",
+        help="Serveurs DNS à interroger avec --resolver dns (par défaut ceux de /etc/resolv.conf)"
+    )
+
+    # Mode résolution d'abord : les noms inexistants ne sont pas sondés en HTTP
+    parser.add_argument(
+        "--resolve_first", action="store_true",
+        help="Résoudre chaque sous-domaine avant de le sonder et déclarer invalides les noms inexistants sans sonde HTTP"
+    )
+
+    # Débits des sondes HTTP, pour ne surcharger aucun serveur (CDN, répartiteur de charge) ni aucun domaine
+    parser.add_argument(
+        "--rate_per_ip", type=float, default=DEFAULT_RATES["ip"], metavar="REQ/S",
+        help="Nombre maximal de sondes HTTP par seconde vers une même adresse IP (0 : sans limite)"
+    )
+    parser.add_argument(
+        "--rate_per_domain", type=float, default=DEFAULT_RATES["apex"], metavar="REQ/S",
+        help="Nombre maximal de sondes HTTP par seconde vers les sous-domaines d'un même domaine (0 : sans limite)"
+    )
+
+    # Méthode des sondes HTTP : HEAD d'abord pour limiter le volume téléchargé
+    parser.add_argument(
+        "--probe_method", choices=["get", "head"], default="get",
+        help="Sondes HTTP en GET (début du corps lu pour le titre et l'empreinte de la page) ou en HEAD (repli en GET fermé dès les en-têtes)"
+    )
+
+    # Délais des sondes HTTP
+    parser.add_argument(
+        "--fixed_timeouts", action="store_true",
+        help="Sonder chaque port avec le délai fixe, sans vérification TCP préalable ni délais déduits des latences observées"
+    )
+
+    # Cache de l'énumération d'un scan à l'autre
+    parser.add_argument(
+        "--enumeration_cache_ttl", type=float, default=DEFAULT_ENUMERATION_CACHE_TTL, metavar="HEURES",
+        help="Durée pendant laquelle les sous-domaines trouvés par un outil pour un domaine sont réutilisés sans relancer l'outil ; 0 pour désactiver le cache"
+    )
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="Relancer tous les outils d'énumération sans lire le cache (leurs nouveaux résultats y sont enregistrés)"
+    )
+
+    # Reprise d'un scan interrompu à partir de son journal
+    parser.add_argument(
+        "--resume", metavar="JOURNAL",
+        help="Reprendre un scan interrompu à partir de son journal (Scan_du_<date>_journal.sqlite) : les étapes terminées, "
+             "les domaines traités et les sous-domaines déjà énumérés, sondés ou capturés ne sont pas refaits"
+    )
+
     args = parser.parse_args()
 
+    journal = None
+    if args.resume:
+        if not os.path.exists(args.resume):
+            print(f"⚠  Erreur : le journal {args.resume} n'existe pas.")
+            return
+        journal = ScanJournal(args.resume)
+
     # Si aucun argument n'est passé, afficher un message d'aide
-    if not args.d and not args.fd and not args.dr:
+    if not args.d and not args.fd and not args.dr and not journal:
         parser.print_help()  # Affiche le message d'aide
         print("\n⚠  Erreur : Vous devez fournir soit un domaine avec l'option -d, soit un fichier avec l'option -fd, soit un répertoire avec l'option -dr.\n")
         return
@@ -100,8 +303,10 @@ def main():
         "subfinder": lambda domain: ["subfinder", "-d", domain]               # Commenté
     }
 
-    # Vérification des domaines
-    if args.d:
+    # Vérification des domaines (à la reprise, ceux du journal par défaut)
+    if journal and not args.d and not args.fd and not args.dr:
+        domains = json.loads(journal.get("domains", "[]"))
+    elif args.d:
         domains = [args.d]
     elif args.fd and os.path.exists(args.fd):
         with open(args.fd) as f:
@@ -114,84 +319,178 @@ def main():
 
     # Début du traitement
     start_time = time.time()
-    time_now = datetime.now().strftime('%Y-%m-%d_%H-%M')
+    if journal:
+        # Les fichiers du scan repris gardent leurs noms d'origine
+        time_now = journal.get("time_now")
+        print(f"⚙  Reprise du scan du {time_now} à partir du journal {args.resume}.")
+    else:
+        time_now = datetime.now().strftime('%Y-%m-%d_%H-%M')
+        journal_file = f"Scan_du_{time_now}_journal.sqlite"
+        # Nouveau scan : le journal d'un scan lancé dans la même minute ne doit pas faire sauter ses étapes, et ses
+        # fichiers de résultats (ouverts en ajout) sont vidés pour ne pas mêler les résultats des deux scans
+        for path in (journal_file, f"{journal_file}-wal", f"{journal_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        for path in result_file_names(f"Scan_du_{time_now}_results.txt"):
+            if os.path.exists(path):
+                open(path, 'w').close()
+        journal = ScanJournal(journal_file)
+        journal.set("time_now", time_now)
+        journal.set("domains", json.dumps(domains))
+        print(f"⚙  Journal du scan : {journal_file} (reprise possible avec --resume {journal_file}).")
     output_file = f"Scan_du_{time_now}_results.txt"
+    record_file = record_file_name(output_file)
+    captures = CaptureStore(captures_directory(record_file))
     invalid_output_file = f"Invalide_Scan_du_{time_now}_results.txt"
     rapport_html_complet = f"Rapport_complet_scan_du_{time_now}.html"
     rapport_html = f"Rapport_minimaliste_scan_du_{time_now}.html"
 
-    # Exécution des domaines en parallèle
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(process_domain, domain, tools, output_file): domain for domain in domains}
+    # Exécution des domaines dans un pipeline unique aux limites de concurrence bornées
+    scheduler = Scheduler({
+        "enumeration": args.max_enumeration,
+        "http": args.max_http,
+        "dns": args.max_dns,
+        "capture": args.max_captures,
+    }, rates={
+        "ip": args.rate_per_ip,
+        "apex": args.rate_per_domain,
+    })
+    # Une étape n'est marquée terminée que si les sondes le sont : sinon elle est refaite à la reprise,
+    # avec les résultats des domaines restants
+    def mark_stage(name):
+        if journal.stage_done("probes"):
+            journal.mark_stage(name)
 
-        for future in concurrent.futures.as_completed(futures):
-            domain = futures[future]
-            try:
-                future.result()  # Attendre que chaque future se termine
-            except Exception as exc:
-                print(f"⚠  Erreur pour le domaine {domain} : {exc}")
-            else:
-                print(f"⚙  Le traitement de {domain} est terminé.")
+    if journal.stage_done("probes"):
+        print("⚙  Reprise : énumération et sondes déjà terminées.")
+    else:
+        # Les résultats écrits après le dernier point de reprise sont retirés, leurs sous-domaines sont sondés à nouveau
+        removed = journal.restore_files()
+        if removed:
+            print(f"⚙  Reprise : {removed} octets de résultats postérieurs au dernier point de reprise retirés.")
+        nameservers = args.nameservers.split(",") if args.nameservers else None
+        resolver = ResolverStage(make_resolver(args.resolver, nameservers), scheduler)
+        enumeration_cache = EnumerationCache(ttl=args.enumeration_cache_ttl, refresh=args.refresh) if args.enumeration_cache_ttl > 0 else None
+        if asyncio.run(run_pipeline(domains, tools, output_file, scheduler, resolver, args.resolve_first, args.probe_method,
+                                    not args.fixed_timeouts, journal, enumeration_cache)):
+            journal.mark_stage("probes")
 
-    # Exécution du script capture.py avec le input et output en argument. 
-    try:
-        subprocess.run(["python", "capture.py", output_file], check=True)
-        print(f"Le script capture.py a été exécuté avec succès.")
-    except subprocess.CalledProcessError as e:
-        print(f"Erreur lors de l'exécution de capture.py : {str(e)}")
+    # Captures d'écran, dans le même processus : les enregistrements sont écrits dans le fichier d'enregistrements au fil des captures
+    if not journal.stage_done("capture"):
+        try:
+            capture.process_file(
+                output_file, Scheduler({"capture": args.max_captures}), args.capture_engine,
+                cache_ttl=args.capture_cache_ttl, journal=journal
+            )
+            print("⚙  Les captures d'écran ont été réalisées avec succès.")
+            mark_stage("capture")
+            # Les lignes capturées sont désormais dans le fichier de résultats
+            if journal.stage_done("capture"):
+                journal.clear_captures()
+        except Exception as e:
+            print(f"⚠  Erreur lors des captures d'écran : {str(e)}")
 
     # Durée d'exécution
     duration = time.time() - start_time
     print_message(f"⚙  Le script s'est terminé en {duration:.2f} secondes.")
-    try:
-        print("⚙  Exécution du script generateur_rapport_minimaliste.py pour les domaines invalides...")
-        subprocess.run(["python", "generateur_rapport_minimaliste.py", invalid_output_file, "-o", "Rapports_domaines_invalides"], check=True)
-        print(f"⚙  Le script generateur_rapport_minimaliste.py pour les domaines invalides a été exécuté avec succès {invalid_output_file}.")
-    except subprocess.CalledProcessError as e:
-        print(f"⚠  Erreur lors de l'exécution de generateur_rapport_minimaliste.py pour les domaines invalides: {str(e)}")
+    if not journal.stage_done("invalid_report"):
+        try:
+            print("⚙  Génération du rapport minimaliste des domaines invalides...")
+            generateur_rapport_minimaliste.process_file(invalid_output_file, "Rapports_domaines_invalides")
+            print(f"⚙  Le rapport des domaines invalides a été généré avec succès à partir de {invalid_output_file}.")
+            mark_stage("invalid_report")
+        except Exception as e:
+            print(f"⚠  Erreur lors de la génération du rapport des domaines invalides : {str(e)}")
+
+    # Enregistrements capturés, relus au fur et à mesure depuis le fichier d'enregistrements
+    def result_rows():
+        return iter_records(record_file)
 
     # Gestion du rapport généré
     if args.minimaliste:
         rapport_directory = "Rapports_domaines_minimaliste"
         rapport_file = rapport_html
-        try:
-            print("⚙  Exécution du script generateur_rapport_minimaliste_images.py...")
-            subprocess.run(["python", "generateur_rapport_minimaliste_images.py", output_file, "-o", rapport_directory, "-f", rapport_file], check=True)
-            print(f"⚙  Le script generateur_rapport_minimaliste_images.py a été exécuté avec succès avec le fichier {output_file}.")
-        except subprocess.CalledProcessError as e:
-            print(f"⚠  Erreur lors de l'exécution de generateur_rapport_minimaliste_images.py : {str(e)}")    
+        if not journal.stage_done("report_minimaliste"):
+            try:
+                print("⚙  Génération du rapport minimaliste avec images...")
+                generateur_rapport_minimaliste_images.generate_html_report(
+                    generateur_rapport_minimaliste_images.iter_entries(result_rows(), captures), rapport_directory, rapport_file,
+                    args.external_images
+                )
+                print(f"⚙  Le rapport minimaliste a été généré avec succès à partir de {record_file}.")
+                mark_stage("report_minimaliste")
+            except Exception as e:
+                print(f"⚠  Erreur lors de la génération du rapport minimaliste : {str(e)}")
     else:
         rapport_directory = "Rapports_domaines_complets"
         rapport_file = rapport_html_complet
-        # Si l'argument minimaliste n'est PAS passé, exécuter database.py et Generateur_rapport.py
-        try:
-            print("⚙  Exécution du script database.py avec le fichier généré...")
-            subprocess.run(["python", "database.py", output_file], check=True)
-            print(f"⚙  Le script database.py a été exécuté avec succès avec le fichier {output_file}.")
-        except subprocess.CalledProcessError as e:
-            print(f"⚠  Erreur lors de l'exécution de database.py : {str(e)}")
+        # Si l'argument minimaliste n'est PAS passé, insertion dans la base de données puis rapport complet
+        # L'insertion n'est faite qu'une fois, pour un scan complet : un scan repris n'est pas inséré une seconde fois
+        if not journal.stage_done("probes"):
+            print(f"⚠  Scan incomplet, non inséré dans la base de données : relancer avec --resume {journal.path}.")
+        elif not journal.stage_done("database"):
+            print("⚙  Insertion des résultats dans la base de données...")
+            if database.insert_rows(result_rows(), captures, database.iter_probe_details(output_file)) is not None:
+                print(f"⚙  Les résultats de {record_file} ont été insérés avec succès.")
+                mark_stage("database")
+            else:
+                print(f"⚠  Erreur lors de l'insertion des résultats de {record_file} dans la base de données.")
 
-        # Exécution du script Generateur_rapport.py
-        try:
-            print("⚙  Exécution du script generateur_rapport_complet_images.py...")
-            subprocess.run(["python", "generateur_rapport_complet_images.py", "-o", rapport_directory, "-f", rapport_file], check=True)
-            print("⚙  Le script generateur_rapport_complet_images.py a été exécuté avec succès.")
+        # Génération du rapport complet à partir de la base de données
+        if not journal.stage_done("report_complet"):
+            try:
+                print("⚙  Génération du rapport complet avec images...")
+                if generateur_rapport_complet_images.generate_report(
+                    rapport_directory, rapport_file, external_images=args.external_images, split_by=args.split_by,
+                    page_size=args.page_size or generateur_rapport_complet_images.DEFAULT_PAGE_SIZE
+                ):
+                    print("⚙  Le rapport complet a été généré avec succès.")
+                    mark_stage("report_complet")
+            except Exception as e:
+                print(f"⚠  Erreur lors de la génération du rapport complet : {str(e)}")
 
-        except subprocess.CalledProcessError as e:
-            print(f"⚠  Erreur lors de l'exécution de Generateur_rapport.py : {str(e)}")
+    # Les captures du scan ne sont lues que par le rapport minimaliste ou par l'insertion dans la base de données (le
+    # rapport complet les lit dans la base) : le répertoire des captures est supprimé une fois cette étape terminée
+    if journal.stage_done("report_minimaliste" if args.minimaliste else "database") and os.path.isdir(captures.directory):
+        shutil.rmtree(captures.directory, ignore_errors=True)
+        print(f"⚙  Répertoire des captures {captures.directory} supprimé.")
 
     # Upload vers AWS S3 si l'URL est fournie
-    if args.s3_url:
+    if args.s3_url and journal.stage_done("upload"):
+        print("⚙  Reprise : le rapport a déjà été uploadé sur AWS.")
+    elif args.s3_url:
         local_report_path = os.path.join(rapport_directory, rapport_file)
         try:
             print(f"⚙  Upload du rapport vers {args.s3_url}...")
             subprocess.run(["aws", "s3", "cp", local_report_path, args.s3_url], check=True)
             print(f"⚙  Le rapport a été uploadé avec succès vers {args.s3_url}.")
+
+            # Les pages et les captures externes sont référencées par un chemin relatif : elles sont uploadées à côté du rapport
+            report_stem = os.path.splitext(rapport_file)[0]
+            s3_directory = args.s3_url if args.s3_url.endswith("/") else args.s3_url.rsplit("/", 1)[0] + "/"
+            if args.split_by and not args.minimaliste:
+                print(f"⚙  Upload des pages du rapport vers {s3_directory}...")
+                subprocess.run([
+                    "aws", "s3", "cp", "--recursive", rapport_directory, s3_directory,
+                    "--exclude", "*", "--include", f"{report_stem}_scan*_page*.html"
+                ], check=True)
+                print(f"⚙  Les pages du rapport ont été uploadées avec succès vers {s3_directory}.")
+
+            images_directory_name = f"{report_stem}_images"
+            local_images_path = os.path.join(rapport_directory, images_directory_name)
+            if args.external_images and os.path.isdir(local_images_path):
+                s3_images_url = f"{s3_directory}{images_directory_name}/"
+                print(f"⚙  Upload des captures vers {s3_images_url}...")
+                subprocess.run(["aws", "s3", "cp", "--recursive", local_images_path, s3_images_url], check=True)
+                print(f"⚙  Les captures ont été uploadées avec succès vers {s3_images_url}.")
+            mark_stage("upload")
         except subprocess.CalledProcessError as e:
             print(f"⚠  Erreur lors de l'upload du rapport vers S3 : {str(e)}")
     else:
         print("Aucune URL S3 spécifiée, le rapport n'a pas été uploadé sur AWS.")
 
+    journal.close()
+
 if __name__ == "__main__":
     main()
 
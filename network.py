@@ -1,36 +1,38 @@
-import requests
+import re
+import time
+import asyncio
+import hashlib
 import socket
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from scheduler import Scheduler
+from resolver import ResolverStage, primary_address
 
-def get_http_code(domain, port):
-    if not domain or len(domain) > 253:
-        return "N/A"
+# Statuts DNS pour lesquels le nom n'a aucune adresse de façon certaine (pas de simple échec temporaire)
+DEAD_STATUSES = ("NXDOMAIN", "NODATA", "ERROR")
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:94.0) Gecko/20100101 Firefox/94.0'
-    }
+# Taille maximale du corps lu par une sonde pour calculer l'empreinte de la page
+FINGERPRINT_BODY_LIMIT = 256 * 1024
 
-    try:
-        url = f"http://{domain}" if port == 80 else f"https://{domain}"
-        response = requests.get(url, headers=headers, timeout=4, allow_redirects=True)  # Suivi des redirections
-        return response.status_code
-    except (requests.RequestException, UnicodeError):
-        return "N/A"
+# Délais adaptatifs : planchers (en secondes) et nombre de mesures nécessaires avant de s'y fier ;
+# le plafond est le délai fixe du sondeur. Le plancher de connexion dépasse le délai de retransmission
+# initial d'un SYN (1 seconde sous Linux) : un seul paquet perdu ne fait pas échouer la connexion
+MIN_CONNECT_TIMEOUT = 1.5
+MIN_REQUEST_TIMEOUT = 1.5
+LATENCY_MIN_SAMPLES = 3
 
-def get_ip_address(subdomain):
-    if not subdomain or len(subdomain) > 253:
-        return "N/A"
+# Codes renvoyés par les serveurs qui refusent HEAD : la sonde est alors refaite en GET
+HEAD_FALLBACK_STATUSES = (405, 501)
 
-    try:
-        ip_address = socket.gethostbyname(subdomain)
-        return ip_address
-    except (socket.gaierror, UnicodeError):
-        return "N/A"
+# Titre de la page, cherché dans le début du corps lu par la sonde
+TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+TITLE_MAX_LENGTH = 200
 
-def get_http_ports_and_ip(subdomain):
-    http_code_80 = get_http_code(subdomain, 80)
-    http_code_443 = get_http_code(subdomain, 443)
-    ip_address = get_ip_address(subdomain)
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:94.0) Gecko/20100101 Firefox/94.0'
+}
 
+def format_probe_result(subdomain, http_code_80, http_code_443, ip_address):
     if http_code_80 == "N/A" and http_code_443 == "N/A":
         return subdomain, "N/A", "N/A", ip_address
     else:
@@ -41,3 +43,425 @@ def get_http_ports_and_ip(subdomain):
             ports.append("443")
 
         return subdomain, f"{http_code_80}-{http_code_443}", "-".join(ports), ip_address
+
+# Fonction pour calculer l'empreinte d'une page : si elle n'a pas changé, sa capture d'écran non plus
+def page_fingerprint(status, headers, body):
+    """
+    Args:
+        status (int): Code HTTP de la réponse.
+        headers (Mapping): En-têtes de la réponse.
+        body (bytes): Début du corps de la réponse (au plus FINGERPRINT_BODY_LIMIT octets).
+
+    Returns:
+        str: Empreinte SHA-256 du code, de Content-Length, ETag, Last-Modified et du corps.
+    """
+    digest = hashlib.sha256()
+    for value in (str(status), headers.get("Content-Length", ""), headers.get("ETag", ""), headers.get("Last-Modified", "")):
+        digest.update(value.encode("utf-8", "replace") + b"\0")
+    digest.update(hashlib.sha256(body).digest())
+    return digest.hexdigest()
+
+# Fonction pour lire le début du corps d'une réponse sans dépasser une taille maximale
+async def read_capped(response, limit):
+    body = bytearray()
+    while len(body) < limit:
+        chunk = await response.content.read(limit - len(body))
+        if not chunk:
+            break
+        body += chunk
+    return bytes(body)
+
+# Fonction pour extraire le titre d'une page (None s'il est absent)
+# Le jeu de caractères annoncé par le serveur n'est pas vérifié : un jeu inconnu est remplacé par UTF-8
+def extract_title(body, charset=None):
+    match = TITLE_PATTERN.search(body)
+    if not match:
+        return None
+    try:
+        text = match.group(1).decode(charset or "utf-8", "replace")
+    except LookupError:
+        text = match.group(1).decode("utf-8", "replace")
+    title = " ".join(text.split())
+    return title[:TITLE_MAX_LENGTH] or None
+
+# Fonction pour lire les noms du certificat TLS présenté par le serveur sur une connexion (vide en HTTP)
+def certificate_names(connection):
+    transport = connection.transport if connection is not None else None
+    ssl_object = transport.get_extra_info("ssl_object") if transport is not None else None
+    if ssl_object is None:
+        return []
+
+    certificate = ssl_object.getpeercert() or {}
+    names = [value for kind, value in certificate.get("subjectAltName", ()) if kind == "DNS"]
+    if not names:
+        names = [value for rdn in certificate.get("subject", ()) for key, value in rdn if key == "commonName"]
+    return names
+
+# Fonction pour décrire une réponse HTTP sondée : ces détails évitent aux étapes suivantes de la redemander
+def response_details(response, body, response_time, tls_names, read_body=True):
+    """
+    Args:
+        response (aiohttp.ClientResponse): Réponse finale (après les redirections).
+        body (bytes): Début du corps lu par la sonde.
+        response_time (float): Délai avant réception des en-têtes, en secondes.
+        tls_names (list): Noms du certificat TLS, relevés à la réception de la réponse (voir _ProbeResponse).
+        read_body (bool): Faux si le corps n'a pas été lu (sondes HEAD) : sans corps, l'empreinte ne verrait
+            pas les changements des pages sans ETag, Last-Modified ni Content-Length, elle est donc omise.
+
+    Returns:
+        dict: Empreinte, URL finale, redirections, titre, serveur, taille, noms TLS et temps de réponse.
+    """
+    content_length = response.headers.get("Content-Length")
+    details = {
+        "final_url": str(response.url),
+        "redirects": [f"{step.status} {step.url}" for step in response.history],
+        "title": extract_title(body, response.charset),
+        "server": response.headers.get("Server"),
+        "content_length": int(content_length) if content_length and content_length.isdigit() else None,
+        "tls_names": tls_names,
+        "response_time_ms": round(response_time * 1000),
+    }
+    if read_body:
+        details["fingerprint"] = page_fingerprint(response.status, response.headers, body)
+    return details
+
+# Fonction pour déduire le domaine principal d'un nom quand il n'est pas connu (deux derniers labels)
+def apex_domain(name):
+    return ".".join(name.rstrip(".").split(".")[-2:]).lower()
+
+# Fonction pour estimer la taille des en-têtes d'une réponse et des redirections qui l'ont précédée
+def headers_size(response):
+    size = 0
+    for step in (*response.history, response):
+        size += len(step.reason or "") + 15  # Ligne de statut
+        size += sum(len(name) + len(value) + 4 for name, value in step.raw_headers)
+    return size
+
+class LatencyTracker:
+    """
+    Latences observées par clé (adresse IP), lissées comme le délai de retransmission de TCP (RFC 6298) :
+    moyenne glissante et variation. Chaque mesure alimente aussi une statistique globale, utilisée pour
+    les clés qui n'ont pas encore assez de mesures.
+    """
+
+    GLOBAL = "*"
+
+    def __init__(self):
+        self.stats = {}  # Clé -> [latence lissée, variation, nombre de mesures]
+
+    def record(self, key, latency):
+        for name in (key, self.GLOBAL):
+            stats = self.stats.get(name)
+            if stats is None:
+                self.stats[name] = [latency, latency / 2, 1]
+            else:
+                smoothed, variation, samples = stats
+                variation = 0.75 * variation + 0.25 * abs(smoothed - latency)
+                smoothed = 0.875 * smoothed + 0.125 * latency
+                self.stats[name] = [smoothed, variation, samples + 1]
+
+    def timeout(self, key, minimum, maximum, factor=2, use_global=True):
+        """
+        Renvoie le délai à accorder à la clé : factor fois (latence lissée + 4 variations), borné par
+        minimum et maximum ; maximum tant qu'aucune statistique n'a assez de mesures. Sans use_global,
+        seules les mesures de la clé elle-même comptent.
+        """
+        for name in ((key, self.GLOBAL) if use_global else (key,)):
+            stats = self.stats.get(name)
+            if stats is not None and stats[2] >= LATENCY_MIN_SAMPLES:
+                return min(maximum, max(minimum, factor * (stats[0] + 4 * stats[1])))
+        return maximum
+
+class _ProbeResponse(aiohttp.ClientResponse):
+    """
+    Réponse qui relève les noms du certificat TLS dès sa réception, tant que la connexion est tenue : aiohttp
+    libère la connexion dès les en-têtes lus quand le corps est vide ou court (HEAD, petites pages).
+    """
+
+    tls_names = []
+
+    async def start(self, connection):
+        self.tls_names = certificate_names(connection)
+        return await super().start(connection)
+
+class _StageResolver(AbstractResolver):
+    """
+    Adaptateur permettant au pool de connexions aiohttp de réutiliser le cache de l'étape
+    de résolution, pour que les sondes HTTP ne résolvent pas une seconde fois le même nom.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    async def resolve(self, host, port=0, family=socket.AF_UNSPEC):
+        resolution = await self.stage.resolve(host)
+        results = []
+        for address in resolution.addresses:
+            address_family = socket.AF_INET6 if ":" in address else socket.AF_INET
+            if family not in (socket.AF_UNSPEC, address_family):
+                continue
+            results.append({
+                "hostname": host, "host": address, "port": port, "family": address_family,
+                "proto": 0, "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+            })
+        if not results:
+            raise OSError(f"Résolution impossible pour {host} ({resolution.status})")
+        return results
+
+    async def close(self):
+        pass
+
+class HttpProber:
+    """
+    Sondeur HTTP asynchrone partageant un seul pool de connexions (keep-alive).
+    Chaque nom est d'abord résolu par l'étape de résolution (toutes les adresses A/AAAA, en cache),
+    puis sondé ; les sous-domaines qui ne répondent qu'à cause d'une zone wildcard sont écartés
+    sans sonde HTTP. Le nombre de sondes HTTP et de résolutions DNS en vol est borné par les
+    étapes "http" et "dns" de l'ordonnanceur.
+
+    Args:
+        scheduler (Scheduler): Ordonnanceur du pipeline (un ordonnanceur par défaut si absent).
+        timeout (float): Délai maximal d'une requête HTTP, en secondes.
+        resolver (ResolverStage): Étape de résolution (une étape par défaut si absente).
+        resolve_first (bool): Si vrai, les noms inexistants (NXDOMAIN, sans adresse) sont déclarés
+            invalides sans aucune sonde HTTP ; seuls les noms résolus sont sondés.
+        probe_method (str): "get" (le début du corps est lu pour les détails de la page) ou "head"
+            (requête HEAD, puis GET fermé dès les en-têtes si le serveur refuse HEAD) pour limiter le trafic.
+        adaptive_timeouts (bool): Si vrai, chaque port (adresse IP, port) est d'abord vérifié par une simple
+            connexion TCP et les délais de connexion et de réponse sont déduits des latences observées sur
+            l'adresse IP, timeout restant le plafond. Un port fermé échoue ainsi immédiatement et un port filtré
+            après le délai de connexion déduit des latences (MIN_CONNECT_TIMEOUT au moins), au lieu du délai complet.
+    """
+
+    def __init__(self, scheduler=None, timeout=4, resolver=None, resolve_first=False, probe_method="get",
+                 adaptive_timeouts=True):
+        self.scheduler = scheduler or Scheduler()
+        self.timeout = timeout
+        self.resolver = resolver or ResolverStage(scheduler=self.scheduler)
+        self.resolve_first = resolve_first
+        self.probe_method = probe_method
+        self.adaptive_timeouts = adaptive_timeouts
+        self.connect_latency = LatencyTracker()
+        self.response_latency = LatencyTracker()
+        self.port_checks = {}      # (adresse IP, port) -> tâche de vérification TCP
+        self.session = None
+        self.wildcard_dropped = 0  # Sous-domaines écartés car résolus uniquement par un wildcard
+        self.dead_skipped = 0      # Sous-domaines inexistants déclarés invalides sans sonde HTTP
+        self.probes_skipped = 0    # Sondes HTTP économisées grâce à la résolution préalable
+        self.details = {}          # Sous-domaine -> {port: détails de la réponse}, lus avec pop_details
+        self.requests_sent = 0     # Requêtes HTTP envoyées (hors redirections)
+        self.bytes_received = 0    # Octets reçus : en-têtes (estimés) et corps lus
+        self.closed_ports = 0      # Sondes HTTP évitées car la connexion TCP préalable a échoué
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.scheduler.limits["http"],   # Taille du pool de connexions
+            resolver=_StageResolver(self.resolver), # Résolutions partagées avec l'étape DNS
+            use_dns_cache=False,                    # Le cache (avec TTL) est celui de l'étape DNS
+            enable_cleanup_closed=True
+        )
+        # Les connexions des sondes alimentent aussi les latences de connexion de leur adresse IP
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(self.on_connection_create_start)
+        trace_config.on_connection_create_end.append(self.on_connection_create_end)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[trace_config],
+            response_class=_ProbeResponse
+        )
+        return self
+
+    async def on_connection_create_start(self, session, context, params):
+        context.connect_started = time.monotonic()
+
+    async def on_connection_create_end(self, session, context, params):
+        # Seule la première connexion d'une requête vise l'adresse connue ; celles des redirections sont ignorées
+        ip_address = (context.trace_request_ctx or {}).get("ip_address")
+        if ip_address and not getattr(context, "connect_recorded", False):
+            context.connect_recorded = True
+            self.connect_latency.record(ip_address, time.monotonic() - context.connect_started)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.resolver.close()
+
+    async def get_http_code(self, domain, port, ip_address=None, apex=None):
+        """
+        Sonde un port d'un nom. Avant d'occuper un emplacement de l'étape "http", la sonde attend que
+        les débits de son adresse IP et de son domaine principal (voir Scheduler.throttle) le permettent.
+        """
+        if not domain or len(domain) > 253:
+            return "N/A"
+
+        known_address = ip_address if ip_address and ip_address != "N/A" else None
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        if self.adaptive_timeouts and known_address:
+            # Port fermé ou filtré : échec immédiat, sans requête HTTP
+            if not await self.port_open(known_address, port):
+                self.closed_ports += 1
+                return "N/A"
+            # Les délais déduits des latences ne portent que sur la connexion et chaque lecture, et seulement pour
+            # une adresse déjà mesurée : le délai total (redirections et corps compris) reste le délai fixe
+            timeout = aiohttp.ClientTimeout(
+                total=self.timeout,
+                sock_connect=self.connect_latency.timeout(known_address, MIN_CONNECT_TIMEOUT, self.timeout, factor=3, use_global=False),
+                sock_read=self.response_latency.timeout(known_address, MIN_REQUEST_TIMEOUT, self.timeout, use_global=False)
+            )
+
+        if known_address:
+            await self.scheduler.throttle("ip", known_address)
+        await self.scheduler.throttle("apex", apex or apex_domain(domain))
+
+        url = f"http://{domain}" if port == 80 else f"https://{domain}"
+        trace_context = {"ip_address": known_address}
+        try:
+            async with self.scheduler.stage("http"):
+                if self.probe_method == "head":
+                    started = time.monotonic()
+                    self.requests_sent += 1
+                    async with self.session.head(url, allow_redirects=True, timeout=timeout, trace_request_ctx=trace_context) as response:  # Suivi des redirections
+                        if response.status not in HEAD_FALLBACK_STATUSES:
+                            return await self.record_response(domain, port, response, started, read_body=False, ip_address=known_address)
+                        # HEAD refusé : ses en-têtes sont comptés avec ceux du GET de repli
+                        self.bytes_received += headers_size(response)
+
+                # En mode HEAD, le GET de repli est fermé dès les en-têtes reçus
+                started = time.monotonic()
+                self.requests_sent += 1
+                async with self.session.get(url, allow_redirects=True, timeout=timeout, trace_request_ctx=trace_context) as response:  # Suivi des redirections
+                    return await self.record_response(domain, port, response, started, read_body=self.probe_method == "get", ip_address=known_address)
+        except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeError, ValueError):
+            return "N/A"
+
+    async def port_open(self, ip_address, port):
+        """
+        Vérifie par une connexion TCP qu'un port accepte les connexions. Une connexion acceptée ou refusée
+        est partagée par tous les noms de la même adresse IP ; une connexion restée sans réponse ne l'est
+        que par les vérifications en cours : les noms suivants vérifient à nouveau le port, un SYN perdu
+        ne condamne donc pas tous les noms d'une adresse (CDN, répartiteur de charge).
+        """
+        key = (ip_address, port)
+        if key not in self.port_checks:
+            self.port_checks[key] = asyncio.ensure_future(self.tcp_connect(ip_address, port))
+        check = self.port_checks[key]
+        result = await asyncio.shield(check)
+        if result is None:
+            if self.port_checks.get(key) is check:
+                del self.port_checks[key]
+            return False
+        return result
+
+    async def tcp_connect(self, ip_address, port):
+        """
+        Returns:
+            bool: True si la connexion est acceptée, False si elle est refusée, None sans réponse dans le délai
+            déduit des latences de l'adresse (voir LatencyTracker.timeout).
+        """
+        timeout = self.connect_latency.timeout(ip_address, MIN_CONNECT_TIMEOUT, self.timeout, factor=3)
+        try:
+            async with self.scheduler.stage("http"):
+                started = time.monotonic()
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout)
+                self.connect_latency.record(ip_address, time.monotonic() - started)
+        except asyncio.TimeoutError:
+            return None
+        except OSError:
+            return False
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def record_response(self, domain, port, response, started, read_body, ip_address=None):
+        """
+        Enregistre les détails d'une réponse (voir pop_details) et le trafic reçu, puis renvoie son code HTTP.
+        """
+        response_time = time.monotonic() - started
+        if ip_address:
+            self.response_latency.record(ip_address, response_time)
+        body = await read_capped(response, FINGERPRINT_BODY_LIMIT) if read_body else b""
+        self.bytes_received += headers_size(response) + len(body)
+        try:
+            self.details.setdefault(domain, {})[str(port)] = response_details(response, body, response_time, response.tls_names, read_body)
+        except Exception as e:
+            # Des détails illisibles (en-têtes mal formés...) ne font pas échouer la sonde : seul le code HTTP est gardé
+            print(f"⚠  Détails de la réponse de {domain}:{port} ignorés : {e}")
+        return response.status
+
+    def pop_details(self, subdomain):
+        """
+        Renvoie (et oublie) les détails des réponses d'un sous-domaine sondé : {port: response_details(...)}.
+        """
+        return self.details.pop(subdomain, {})
+
+    async def get_http_ports_and_ip(self, subdomain, domain=None):
+        """
+        Résout puis sonde un sous-domaine.
+
+        Args:
+            subdomain (str): Le sous-domaine à sonder.
+            domain (str): Domaine principal ; s'il est fourni, les sous-domaines d'une zone wildcard sont écartés.
+
+        Returns:
+            tuple: (subdomain, http_codes, ports, ip), ou None si le sous-domaine a été écarté.
+        """
+        resolution = await self.resolver.resolve(subdomain)
+        if domain and await self.resolver.is_wildcard(subdomain, domain, resolution):
+            self.wildcard_dropped += 1
+            return None
+
+        if self.resolve_first and resolution.status in DEAD_STATUSES:
+            self.dead_skipped += 1
+            self.probes_skipped += 2  # Ports 80 et 443
+            return subdomain, "N/A", "N/A", "N/A"
+
+        ip_address = primary_address(resolution)
+        http_code_80, http_code_443 = await asyncio.gather(
+            self.get_http_code(subdomain, 80, ip_address, domain),
+            self.get_http_code(subdomain, 443, ip_address, domain)
+        )
+        return format_probe_result(subdomain, http_code_80, http_code_443, ip_address)
+
+    async def probe_all(self, subdomains, domain=None):
+        """
+        Sonde les sous-domaines dès qu'ils arrivent et renvoie les résultats au fur et à mesure.
+
+        Args:
+            subdomains (iterable): Itérable, synchrone ou asynchrone, de sous-domaines à sonder.
+            domain (str): Domaine principal, pour écarter les sous-domaines d'une zone wildcard.
+        """
+        done = asyncio.Queue()
+
+        async def probe(subdomain):
+            result = await self.get_http_ports_and_ip(subdomain, domain)
+            if result is not None:
+                await done.put(result)
+
+        async def feed():
+            tasks = []
+            try:
+                if hasattr(subdomains, "__aiter__"):
+                    async for subdomain in subdomains:
+                        tasks.append(asyncio.create_task(probe(subdomain)))
+                else:
+                    tasks = [asyncio.create_task(probe(subdomain)) for subdomain in subdomains]
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await done.put(None)  # Fin des résultats
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while (result := await done.get()) is not None:
+                yield result
+        finally:
+            if not feeder.done():
+                feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+        feeder.result()  # Propage une éventuelle erreur de la source
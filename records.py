@@ -0,0 +1,194 @@
+import os
+import base64
+import struct
+import hashlib
+import binascii
+from typing import NamedTuple
+
+# Signature des fichiers d'enregistrements binaires
+RECORD_FILE_MAGIC = b"SCANREC1\n"
+
+# Entête de chaque enregistrement : longueur en octets des colonnes qui suivent
+RECORD_HEADER = struct.Struct("<I")
+
+# Séparateur des colonnes d'un enregistrement (caractère de contrôle absent des noms, codes et dates)
+FIELD_SEPARATOR = "\x1f"
+
+# Taille des blocs lus dans un fichier d'enregistrements
+READ_CHUNK_SIZE = 1 << 20
+
+class ScanRecord(NamedTuple):
+    """
+    Résultat d'un sous-domaine, partagé par toutes les étapes du pipeline (sondes, captures, base de
+    données, rapports). Les captures ne sont pas dans l'enregistrement : image_http et image_https sont
+    les empreintes SHA-256 des captures du répertoire du scan (voir CaptureStore), ou "" sans capture.
+    """
+    domain: str
+    subdomain: str
+    http_codes: str
+    ports: str
+    ip_address: str
+    scan_time: str
+    image_http: str = ""
+    image_https: str = ""
+
+# Fonctions pour sérialiser un enregistrement en texte (colonnes séparées par FIELD_SEPARATOR, comme dans le
+# fichier d'enregistrements) et le relire ; decode_record renvoie None si le texte n'a pas toutes les colonnes
+def encode_record(record):
+    return FIELD_SEPARATOR.join(record)
+
+def decode_record(text):
+    fields = text.split(FIELD_SEPARATOR)
+    return ScanRecord._make(fields) if len(fields) == len(ScanRecord._fields) else None
+
+# Fonction pour nommer le fichier d'enregistrements produit par les captures à partir du fichier des sondes
+def record_file_name(results_file):
+    return f"{os.path.splitext(results_file)[0]}.rec"
+
+# Fonction pour nommer le répertoire des captures d'un scan (commun au fichier texte et au fichier d'enregistrements)
+def captures_directory(results_file):
+    return f"{os.path.splitext(results_file)[0]}_captures"
+
+class CaptureStore:
+    """
+    Captures d'un scan, stockées hors des enregistrements : un fichier PNG par contenu, nommé par son
+    empreinte SHA-256. Seules les étapes qui affichent ou archivent les captures les lisent.
+
+    Args:
+        directory (str): Répertoire des captures (voir captures_directory).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, sha256):
+        return os.path.join(self.directory, f"{sha256}.png")
+
+    def put(self, content):
+        """
+        Enregistre une capture et renvoie son empreinte ("" pour une capture vide).
+        """
+        if not content:
+            return ""
+        sha256 = hashlib.sha256(content).hexdigest()
+        image_path = self.path(sha256)
+        if not os.path.exists(image_path):
+            os.makedirs(self.directory, exist_ok=True)
+            # Écriture atomique : une capture interrompue n'est jamais lue à moitié
+            temporary_path = f"{image_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(content)
+            os.replace(temporary_path, image_path)
+        return sha256
+
+    def put_base64(self, image_base64):
+        try:
+            return self.put(base64.b64decode(image_base64, validate=True)) if image_base64 else ""
+        except (binascii.Error, ValueError):
+            return ""
+
+    def has(self, sha256):
+        return bool(sha256) and os.path.exists(self.path(sha256))
+
+    def get(self, sha256):
+        """
+        Renvoie le contenu d'une capture, ou None si elle est absente.
+        """
+        if not sha256:
+            return None
+        try:
+            with open(self.path(sha256), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+class RecordWriter:
+    """
+    Écrit un fichier d'enregistrements binaire : une signature, puis pour chaque enregistrement sa
+    longueur suivie de ses colonnes encodées en UTF-8 (voir FIELD_SEPARATOR). Les captures n'y figurent
+    que par leur empreinte, le fichier reste donc petit et se relit sans décoder de Base64.
+    Le fichier est écrit à côté de sa destination puis la remplace atomiquement à la fermeture.
+
+    Args:
+        path (str): Chemin du fichier d'enregistrements.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.temporary_path = f"{path}.tmp"
+        self.file = None
+        self.count = 0
+
+    def __enter__(self):
+        self.file = open(self.temporary_path, "wb")
+        self.file.write(RECORD_FILE_MAGIC)
+        return self
+
+    def write(self, record):
+        payload = encode_record(record).encode("utf-8")
+        self.file.write(RECORD_HEADER.pack(len(payload)) + payload)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temporary_path, self.path)
+        else:
+            os.remove(self.temporary_path)
+
+# Fonction pour convertir une ligne texte (6 colonnes des sondes, ou 8 colonnes avec captures Base64) en enregistrement
+# Les captures Base64 d'une ligne sont déplacées dans captures (ou ignorées sans CaptureStore) ; renvoie None si la ligne est mal formée
+def parse_line(line, captures=None):
+    fields = line.strip().split(',')
+    if len(fields) == 6:
+        return ScanRecord(*fields)
+    if len(fields) == 8:
+        image_http, image_https = (captures.put_base64(value) if captures else "" for value in fields[6:])
+        return ScanRecord(*fields[:6], image_http, image_https)
+    return None
+
+def iter_records(path, captures=None):
+    """
+    Lit un fichier de résultats, un enregistrement à la fois : fichier d'enregistrements binaire (voir
+    RecordWriter) ou fichier texte (voir parse_line), reconnu à sa signature. Les captures ne sont jamais
+    lues ici : seules les étapes qui en ont besoin les chargent depuis le CaptureStore du scan.
+
+    Args:
+        path (str): Fichier de résultats.
+        captures (CaptureStore): Destination des captures Base64 d'un fichier texte à 8 colonnes.
+
+    Yields:
+        ScanRecord: Enregistrement de chaque ligne valide.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(RECORD_FILE_MAGIC)) == RECORD_FILE_MAGIC:
+            # Le fichier est lu par blocs, la mémoire utilisée ne dépend pas de sa taille
+            header_size, unpack, make = RECORD_HEADER.size, RECORD_HEADER.unpack_from, ScanRecord._make
+            buffer = b""
+            position = 0
+            while True:
+                # Tous les enregistrements complets du bloc
+                size = len(buffer)
+                while position + header_size <= size:
+                    start = position + header_size
+                    end = start + unpack(buffer, position)[0]
+                    if end > size:
+                        break
+                    yield make(buffer[start:end].decode("utf-8").split(FIELD_SEPARATOR))
+                    position = end
+
+                chunk = file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    if position < size:
+                        print(f"Enregistrement tronqué à la fin de {path}")
+                    return
+                buffer = buffer[position:] + chunk
+                position = 0
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            record = parse_line(line, captures)
+            if record is None:
+                print(f"Ligne mal formatée: {line.strip()}")
+                continue
+            yield record
@@ -0,0 +1,123 @@
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+
+try:
+    from PIL import Image  # Optionnel : génération des miniatures
+except ImportError:
+    Image = None
+
+class HtmlReportWriter:
+    """
+    Écrit un rapport HTML au fil de l'eau : chaque morceau est écrit sur disque dès qu'il est produit,
+    la mémoire utilisée ne dépend donc pas de la taille du rapport.
+
+    L'entête (qui contient souvent des statistiques connues seulement à la fin) peut être fournie à tout
+    moment avec set_header : le corps est écrit dans un fichier temporaire du répertoire de sortie, puis
+    recopié derrière l'entête à la fermeture. Le rapport final remplace atomiquement le fichier de sortie.
+
+    Args:
+        output_directory (str): Répertoire de sortie (créé s'il n'existe pas).
+        filename (str): Nom du fichier HTML.
+    """
+
+    def __init__(self, output_directory, filename):
+        self.output_directory = output_directory
+        self.path = os.path.join(output_directory, filename)
+        self.header = ""
+        self.body = None
+
+    def __enter__(self):
+        os.makedirs(self.output_directory, exist_ok=True)
+        self.body = tempfile.TemporaryFile("w+", encoding="utf-8", dir=self.output_directory)
+        return self
+
+    def set_header(self, html):
+        self.header = html
+
+    def write(self, html):
+        self.body.write(html)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                temporary_path = f"{self.path}.tmp"
+                with open(temporary_path, "w", encoding="utf-8") as file:
+                    file.write(self.header)
+                    self.body.seek(0)
+                    shutil.copyfileobj(self.body, file, 1 << 20)
+                os.replace(temporary_path, self.path)
+        finally:
+            self.body.close()
+
+class ImageStore:
+    """
+    Enregistre les captures d'un rapport dans un répertoire voisin du fichier HTML, au lieu de les
+    intégrer en Base64 : chaque capture est écrite une seule fois (nommée par l'empreinte SHA-256 de
+    son contenu) avec une miniature, et le rapport n'affiche que la miniature chargée à la demande.
+
+    Les miniatures sont générées avec Pillow s'il est installé ; à défaut, la capture complète est
+    affichée réduite par le navigateur.
+
+    Args:
+        output_directory (str): Répertoire de sortie du rapport.
+        report_filename (str): Nom du fichier HTML du rapport (le répertoire d'images en dérive).
+        thumbnail_size (tuple): Taille maximale (largeur, hauteur) des miniatures.
+    """
+
+    def __init__(self, output_directory, report_filename, thumbnail_size=(320, 200)):
+        self.directory_name = f"{os.path.splitext(report_filename)[0]}_images"
+        self.directory = os.path.join(output_directory, self.directory_name)
+        self.thumbnail_size = thumbnail_size
+        self.paths = {}  # empreinte -> (chemin relatif de l'image, chemin relatif de la miniature)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def add(self, content):
+        """
+        Enregistre une capture PNG et renvoie les chemins relatifs (image complète, miniature).
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        if sha256 in self.paths:
+            return self.paths[sha256]
+
+        image_name = f"{sha256}.png"
+        image_path = os.path.join(self.directory, image_name)
+        if not os.path.exists(image_path):
+            # Écriture atomique : plusieurs processus peuvent produire la même capture en parallèle
+            temporary_path = f"{image_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(content)
+            os.replace(temporary_path, image_path)
+
+        thumbnail_name = f"{sha256}_thumb.png"
+        thumbnail_path = os.path.join(self.directory, thumbnail_name)
+        if not os.path.exists(thumbnail_path) and not self._write_thumbnail(content, thumbnail_path):
+            thumbnail_name = image_name
+
+        self.paths[sha256] = (f"{self.directory_name}/{image_name}", f"{self.directory_name}/{thumbnail_name}")
+        return self.paths[sha256]
+
+    def _write_thumbnail(self, content, thumbnail_path):
+        if Image is None:
+            return False
+        try:
+            temporary_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+            with Image.open(io.BytesIO(content)) as image:
+                image.thumbnail(self.thumbnail_size)
+                image.save(temporary_path, "PNG", optimize=True)
+            os.replace(temporary_path, thumbnail_path)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def render(self, content, label):
+        """
+        Renvoie le HTML d'une capture : miniature chargée à la demande, lien vers l'image complète.
+        """
+        image_path, thumbnail_path = self.add(content)
+        return (
+            f'<a href="{image_path}" target="_blank">'
+            f'<img class="thumbnail" src="{thumbnail_path}" loading="lazy" alt="{label}"/></a>'
+        )
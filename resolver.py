@@ -0,0 +1,467 @@
+import asyncio
+import random
+import socket
+import string
+import struct
+from collections import namedtuple
+from scheduler import Scheduler
+
+# Types d'enregistrements DNS utilisés
+QTYPE_A = 1
+QTYPE_SOA = 6
+QTYPE_AAAA = 28
+
+# Codes de réponse DNS
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+DEFAULT_TTL = 300           # TTL appliqué quand le résolveur ne fournit pas de TTL
+DEFAULT_NEGATIVE_TTL = 60   # TTL des réponses négatives sans SOA
+MAX_TTL = 3600              # Durée maximale de conservation en cache
+
+# Résultat d'une résolution : statut ("NOERROR", "NODATA", "NXDOMAIN", "SERVFAIL", "TIMEOUT", "ERROR"),
+# tuple de toutes les adresses A/AAAA et TTL en secondes
+Resolution = namedtuple("Resolution", ["status", "addresses", "ttl"])
+
+def encode_name(name):
+    """
+    Encode un nom de domaine au format DNS (suite de labels préfixés par leur longueur).
+    Lève UnicodeError si le nom est invalide.
+    """
+    encoded = b""
+    for label in name.rstrip(".").split("."):
+        label = label.encode("idna")
+        if not label or len(label) > 63:
+            raise UnicodeError(f"Label DNS invalide dans {name}")
+        encoded += bytes([len(label)]) + label
+    return encoded + b"\x00"
+
+def read_name(data, offset):
+    """
+    Lit un nom (éventuellement compressé) dans un message DNS.
+
+    Returns:
+        tuple: (nom, position qui suit le nom dans le message)
+    """
+    labels = []
+    end = None
+    for _ in range(128):  # Protection contre les boucles de pointeurs
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack("!H", data[offset:offset + 2])[0] & 0x3FFF
+        elif length == 0:
+            return ".".join(labels), (end if end is not None else offset + 1)
+        else:
+            labels.append(data[offset + 1:offset + 1 + length].decode("ascii", errors="replace"))
+            offset += 1 + length
+    raise ValueError("Nom DNS mal formé")
+
+def encode_query(query_id, name, qtype):
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # Récursion demandée
+    return header + encode_name(name) + struct.pack("!HH", qtype, 1)
+
+def read_question(data):
+    """
+    Lit la question d'un message DNS.
+
+    Returns:
+        tuple: (nom en minuscules sans point final, type), ou None si le message n'a pas exactement une question.
+    """
+    qdcount = struct.unpack("!H", data[4:6])[0]
+    if qdcount != 1:
+        return None
+    name, offset = read_name(data, 12)
+    qtype = struct.unpack("!H", data[offset:offset + 2])[0]
+    return name.rstrip(".").lower(), qtype
+
+def decode_response(data):
+    """
+    Décode une réponse DNS.
+
+    Returns:
+        tuple: (rcode, liste de (type, ttl, adresse) pour les enregistrements A/AAAA, TTL négatif du SOA ou None)
+    """
+    _, flags, qdcount, ancount, nscount, _ = struct.unpack("!HHHHHH", data[:12])
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = read_name(data, offset)
+        offset += 4
+
+    records = []
+    negative_ttl = None
+    for index in range(ancount + nscount):
+        _, offset = read_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        offset += rdlength
+
+        if index < ancount and rtype == QTYPE_A and rdlength == 4:
+            records.append((rtype, ttl, socket.inet_ntop(socket.AF_INET, rdata)))
+        elif index < ancount and rtype == QTYPE_AAAA and rdlength == 16:
+            records.append((rtype, ttl, socket.inet_ntop(socket.AF_INET6, rdata)))
+        elif index >= ancount and rtype == QTYPE_SOA:
+            # Le TTL négatif est le minimum entre le TTL du SOA et son champ "minimum"
+            minimum = struct.unpack("!I", rdata[-4:])[0]
+            negative_ttl = min(ttl, minimum)
+
+    return flags & 0x000F, records, negative_ttl
+
+def read_system_nameservers(path="/etc/resolv.conf"):
+    """
+    Lit les serveurs DNS configurés sur le système.
+    """
+    nameservers = []
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    nameservers.append(parts[1])
+    except OSError:
+        pass
+    return nameservers or ["8.8.8.8"]
+
+class _DnsClientProtocol(asyncio.DatagramProtocol):
+    """
+    Point de terminaison UDP partagé par toutes les requêtes vers un serveur DNS.
+    Les réponses sont associées aux requêtes par leur identifiant, puis vérifiées par leur question (nom et
+    type) : une réponse tardive à une requête expirée dont l'identifiant a été réutilisé est ignorée.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        query_id = struct.unpack("!H", data[:2])[0]
+        entry = self.pending.get(query_id)
+        if entry is None:
+            return
+        future, question = entry
+        try:
+            if read_question(data) != question:
+                return
+        except (ValueError, struct.error, IndexError):
+            return
+        del self.pending[query_id]
+        if not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Point de terminaison DNS fermé"))
+        self.pending.clear()
+
+    async def query(self, payload_for_id, timeout):
+        """
+        Envoie une requête et attend la réponse dont l'identifiant et la question (nom, type) correspondent.
+        """
+        loop = asyncio.get_running_loop()
+        query_id = random.randrange(65536)
+        while query_id in self.pending:
+            query_id = random.randrange(65536)
+
+        payload = payload_for_id(query_id)
+        future = loop.create_future()
+        self.pending[query_id] = (future, read_question(payload))
+        try:
+            self.transport.sendto(payload)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self.pending.get(query_id, (None,))[0] is future:
+                del self.pending[query_id]
+
+class DnsResolver:
+    """
+    Résolveur DNS asynchrone interrogeant directement des serveurs DNS en UDP.
+    Toutes les requêtes vers un même serveur partagent un seul socket.
+
+    Args:
+        nameservers (list): Serveurs DNS, sous forme "adresse" ou (adresse, port) ; ceux du système par défaut.
+        timeout (float): Délai d'attente d'une réponse, en secondes.
+        attempts (int): Nombre de tentatives par requête, en alternant les serveurs.
+    """
+
+    def __init__(self, nameservers=None, timeout=2, attempts=2):
+        self.nameservers = [
+            (server, 53) if isinstance(server, str) else tuple(server)
+            for server in (nameservers or read_system_nameservers())
+        ]
+        self.timeout = timeout
+        self.attempts = attempts
+        self.endpoints = {}
+        self.lock = asyncio.Lock()
+
+    async def _endpoint(self, nameserver):
+        async with self.lock:
+            if nameserver not in self.endpoints:
+                loop = asyncio.get_running_loop()
+                _, protocol = await loop.create_datagram_endpoint(_DnsClientProtocol, remote_addr=nameserver)
+                self.endpoints[nameserver] = protocol
+            return self.endpoints[nameserver]
+
+    async def query(self, name, qtype):
+        """
+        Envoie une requête et renvoie la réponse décodée, ou None si aucun serveur n'a répondu.
+        """
+        for attempt in range(self.attempts):
+            nameserver = self.nameservers[attempt % len(self.nameservers)]
+            try:
+                endpoint = await self._endpoint(nameserver)
+                data = await endpoint.query(lambda query_id: encode_query(query_id, name, qtype), self.timeout)
+                return decode_response(data)
+            except (asyncio.TimeoutError, OSError, ValueError, struct.error, IndexError):
+                continue
+        return None
+
+    async def resolve(self, name):
+        try:
+            encode_name(name)
+        except UnicodeError:
+            return Resolution("ERROR", (), 0)
+
+        answers = await asyncio.gather(self.query(name, QTYPE_A), self.query(name, QTYPE_AAAA))
+        addresses = []
+        ttls = []
+        negative_ttls = []
+        rcodes = []
+        for answer in answers:
+            if answer is None:
+                continue
+            rcode, records, negative_ttl = answer
+            rcodes.append(rcode)
+            for _, ttl, address in records:
+                if address not in addresses:
+                    addresses.append(address)
+                ttls.append(ttl)
+            if negative_ttl is not None:
+                negative_ttls.append(negative_ttl)
+
+        if addresses:
+            return Resolution("NOERROR", tuple(addresses), min(ttls))
+        if not rcodes:
+            return Resolution("TIMEOUT", (), 0)
+        negative_ttl = min(negative_ttls) if negative_ttls else DEFAULT_NEGATIVE_TTL
+        if RCODE_NXDOMAIN in rcodes:
+            return Resolution("NXDOMAIN", (), negative_ttl)
+        if all(rcode == RCODE_NOERROR for rcode in rcodes):
+            return Resolution("NODATA", (), negative_ttl)
+        return Resolution("SERVFAIL", (), 0)
+
+    def close(self):
+        for protocol in self.endpoints.values():
+            protocol.transport.close()
+        self.endpoints.clear()
+
+class SystemResolver:
+    """
+    Résolveur passant par getaddrinfo (résolveur de la libc, exécuté dans des threads).
+    Ne fournit pas de TTL : DEFAULT_TTL est appliqué.
+    """
+
+    async def resolve(self, name):
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno == socket.EAI_NONAME:
+                return Resolution("NXDOMAIN", (), DEFAULT_NEGATIVE_TTL)
+            if e.errno == getattr(socket, "EAI_NODATA", None):
+                return Resolution("NODATA", (), DEFAULT_NEGATIVE_TTL)
+            return Resolution("SERVFAIL", (), 0)
+        except UnicodeError:
+            return Resolution("ERROR", (), 0)
+
+        addresses = []
+        for info in infos:
+            if info[4][0] not in addresses:
+                addresses.append(info[4][0])
+        return Resolution("NOERROR", tuple(addresses), DEFAULT_TTL)
+
+    def close(self):
+        pass
+
+def make_resolver(kind="dns", nameservers=None):
+    """
+    Construit le résolveur demandé : "dns" (requêtes UDP directes) ou "system" (getaddrinfo).
+    """
+    if kind == "system":
+        return SystemResolver()
+    return DnsResolver(nameservers)
+
+def primary_address(resolution):
+    """
+    Adresse affichée dans les résultats : la première IPv4, à défaut la première adresse, sinon "N/A".
+    """
+    for address in resolution.addresses:
+        if ":" not in address:
+            return address
+    return resolution.addresses[0] if resolution.addresses else "N/A"
+
+class ResolverStage:
+    """
+    Étape de résolution du pipeline : résout les noms en parallèle (dans la limite de l'étape "dns"
+    de l'ordonnanceur), garde les réponses en cache selon leur TTL et détecte les zones wildcard.
+
+    Args:
+        resolver: Résolveur sous-jacent (DnsResolver, SystemResolver ou tout objet ayant `resolve(name)`).
+        scheduler (Scheduler): Ordonnanceur du pipeline.
+    """
+
+    def __init__(self, resolver=None, scheduler=None):
+        self.resolver = resolver or make_resolver()
+        self.scheduler = scheduler or Scheduler()
+        self.cache = {}       # nom -> (expiration, Resolution)
+        self.inflight = {}    # nom -> tâche de résolution en cours
+        self.wildcards = {}   # domaine -> tâche de détection wildcard
+
+    async def resolve(self, name):
+        name = name.lower().rstrip(".")
+        if not name or len(name) > 253:
+            return Resolution("ERROR", (), 0)
+
+        loop = asyncio.get_running_loop()
+        cached = self.cache.get(name)
+        if cached and cached[0] > loop.time():
+            return cached[1]
+
+        # Une seule requête en vol par nom, même si plusieurs étapes le demandent en même temps
+        if name not in self.inflight:
+            self.inflight[name] = asyncio.ensure_future(self._resolve(name))
+        return await asyncio.shield(self.inflight[name])
+
+    async def _resolve(self, name):
+        try:
+            async with self.scheduler.stage("dns"):
+                resolution = await self.resolver.resolve(name)
+            ttl = min(resolution.ttl, MAX_TTL)
+            if ttl > 0:
+                self.cache[name] = (asyncio.get_running_loop().time() + ttl, resolution)
+            return resolution
+        finally:
+            self.inflight.pop(name, None)
+
+    async def wildcard_addresses(self, domain):
+        """
+        Renvoie les adresses vers lesquelles la zone wildcard du domaine répond (ensemble vide sinon).
+        """
+        if domain not in self.wildcards:
+            self.wildcards[domain] = asyncio.ensure_future(self._detect_wildcard(domain))
+        return await asyncio.shield(self.wildcards[domain])
+
+    async def _detect_wildcard(self, domain):
+        # Deux labels aléatoires qui n'ont aucune chance d'exister réellement
+        names = [
+            "".join(random.choices(string.ascii_lowercase + string.digits, k=16)) + f".{domain}"
+            for _ in range(2)
+        ]
+        resolutions = await asyncio.gather(*(self.resolve(name) for name in names))
+        if all(resolution.addresses for resolution in resolutions):
+            return frozenset(address for resolution in resolutions for address in resolution.addresses)
+        return frozenset()
+
+    async def is_wildcard(self, subdomain, domain, resolution):
+        """
+        Indique si le sous-domaine ne répond que parce que la zone du domaine est wildcard.
+        """
+        if subdomain == domain or not resolution.addresses:
+            return False
+        wildcard = await self.wildcard_addresses(domain)
+        return bool(wildcard) and set(resolution.addresses) <= wildcard
+
+    def close(self):
+        self.resolver.close()
+
+class _StubDnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            self.transport.sendto(self.server.answer(data), addr)
+        except (ValueError, struct.error, IndexError):
+            pass
+
+class StubDnsServer:
+    """
+    Serveur DNS minimal (UDP, local) répondant à partir d'une table, utilisable dans les tests
+    avec DnsResolver([server.address]).
+
+    Args:
+        records (dict): Nom -> liste d'adresses IPv4/IPv6. Un nom "*.exemple.com" répond pour
+            tous les sous-domaines de exemple.com. Les noms absents renvoient NXDOMAIN.
+        host (str): Adresse d'écoute.
+        port (int): Port d'écoute (0 pour un port libre choisi par le système).
+        ttl (int): TTL des réponses.
+    """
+
+    def __init__(self, records, host="127.0.0.1", port=0, ttl=60):
+        self.records = {name.lower().rstrip("."): list(addresses) for name, addresses in records.items()}
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.transport = None
+        self.address = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _StubDnsProtocol(self), local_addr=(self.host, self.port)
+        )
+        self.address = self.transport.get_extra_info("sockname")[:2]
+        return self.address
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def lookup(self, name):
+        name = name.lower().rstrip(".")
+        if name in self.records:
+            return self.records[name]
+        labels = name.split(".")
+        for index in range(1, len(labels)):
+            wildcard = "*." + ".".join(labels[index:])
+            if wildcard in self.records:
+                return self.records[wildcard]
+        return None
+
+    def answer(self, query):
+        query_id, _, _, _, _, _ = struct.unpack("!HHHHHH", query[:12])
+        name, offset = read_name(query, 12)
+        qtype, _ = struct.unpack("!HH", query[offset:offset + 4])
+        question = query[12:offset + 4]
+
+        addresses = self.lookup(name)
+        answers = b""
+        count = 0
+        if addresses is not None:
+            for address in addresses:
+                family, rtype = (socket.AF_INET6, QTYPE_AAAA) if ":" in address else (socket.AF_INET, QTYPE_A)
+                if rtype != qtype:
+                    continue
+                rdata = socket.inet_pton(family, address)
+                # 0xC00C : pointeur vers le nom de la question
+                answers += struct.pack("!HHHIH", 0xC00C, rtype, 1, self.ttl, len(rdata)) + rdata
+                count += 1
+
+        rcode = RCODE_NOERROR if addresses is not None else RCODE_NXDOMAIN
+        header = struct.pack("!HHHHHH", query_id, 0x8180 | rcode, 1, count, 0, 0)
+        return header + question + answers
@@ -1,24 +1,102 @@
-import concurrent.futures
+import os
+import json
 from datetime import datetime
-from network import get_http_ports_and_ip
-
-def filter_and_write_results(subdomains, domain, output_file):
-    # Génère le nom du fichier des sous-domaines invalides en fonction du fichier valide
-    invalid_output_file = f"Invalide_{output_file}"
-    
-    unique_subdomains = set(subdomains)
-    
-    # Ouverture de deux fichiers : un pour les sous-domaines valides et un pour les non valides
-    with open(output_file, 'a') as valid_file, open(invalid_output_file, 'a') as invalid_file:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = {executor.submit(get_http_ports_and_ip, subdomain): subdomain for subdomain in unique_subdomains}
-            
-            for future in concurrent.futures.as_completed(futures):
-                subdomain, http_codes, ports, ip_address = future.result()
-                
-                # Si le sous-domaine est valide (pas de "N/A" dans les codes HTTP)
-                if "N/A" not in http_codes:
-                    valid_file.write(f"{domain},{subdomain},{http_codes},{ports},{ip_address},{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                else:
-                    # Si le sous-domaine n'est pas valide, on l'écrit dans le fichier des sous-domaines non valides
-                    invalid_file.write(f"{domain},{subdomain},N/A,N/A,N/A,{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+from journal import CHECKPOINT_INTERVAL
+
+# Fonction pour nommer le fichier des détails des sondes (empreintes des pages, une ligne JSON par sous-domaine)
+def details_file_name(output_file):
+    directory, filename = os.path.split(output_file)
+    return os.path.join(directory, f"Details_{os.path.splitext(filename)[0]}.jsonl")
+
+# Fonction pour lister les fichiers de résultats d'un scan : sous-domaines valides, invalides et détails des sondes
+def result_file_names(output_file):
+    directory, filename = os.path.split(output_file)
+    return [output_file, os.path.join(directory, f"Invalide_{filename}"), details_file_name(output_file)]
+
+class ResultFiles:
+    """
+    Fichiers de résultats d'un scan, partagés par tous les domaines : sous-domaines valides, invalides
+    (Invalide_<fichier>) et détails des sondes (voir details_file_name). Chaque résultat est écrit en une
+    seule fois depuis la boucle asyncio, les lignes de domaines différents ne peuvent donc pas s'entremêler.
+
+    Avec un journal (voir journal.ScanJournal), un point de reprise est enregistré toutes les
+    checkpoint_interval lignes et à la fin de chaque domaine.
+
+    Args:
+        output_file (str): Fichier des sous-domaines valides.
+        journal (ScanJournal): Journal du scan, ou None.
+        checkpoint_interval (int): Nombre de résultats écrits entre deux points de reprise.
+    """
+
+    def __init__(self, output_file, journal=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.output_file = output_file
+        self.journal = journal
+        self.checkpoint_interval = checkpoint_interval
+        self.pending_probes = []
+        self.pending_domains = []
+        self.valid_file, self.invalid_file, self.details_file = (open(path, 'a') for path in result_file_names(output_file))
+        # Premier point de reprise : taille des fichiers au démarrage (ou à la reprise) du scan
+        self.checkpoint()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, domain, subdomain, http_codes, ports, ip_address, details):
+        date_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Si le sous-domaine est valide (pas de "N/A" dans les codes HTTP)
+        if "N/A" not in http_codes:
+            self.valid_file.write(f"{domain},{subdomain},{http_codes},{ports},{ip_address},{date_time}\n")
+            self.details_file.write(json.dumps({"domain": domain, "subdomain": subdomain, "ports": details}) + "\n")
+        else:
+            # Si le sous-domaine n'est pas valide, on l'écrit dans le fichier des sous-domaines non valides
+            self.invalid_file.write(f"{domain},{subdomain},N/A,N/A,N/A,{date_time}\n")
+
+        if self.journal:
+            self.pending_probes.append((domain, subdomain))
+            if len(self.pending_probes) >= self.checkpoint_interval:
+                self.checkpoint()
+
+    def domain_done(self, domain):
+        if self.journal:
+            self.pending_domains.append(domain)
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.journal:
+            self.journal.checkpoint(
+                [self.valid_file, self.invalid_file, self.details_file], self.pending_probes, self.pending_domains
+            )
+            self.pending_probes = []
+            self.pending_domains = []
+
+    def close(self):
+        self.checkpoint()
+        for file in (self.valid_file, self.invalid_file, self.details_file):
+            file.close()
+
+async def filter_and_write_results(subdomains, domain, output_file, prober):
+    """
+    Sonde les sous-domaines et écrit chaque résultat dès qu'il est connu.
+
+    Args:
+        subdomains (iterable): Liste de sous-domaines, ou flux asynchrone déjà dédoublonné
+            (voir tools.stream_subdomains) dont chaque élément est sondé dès son arrivée.
+        domain (str): Le domaine principal.
+        output_file (ResultFiles | str): Fichiers de résultats partagés du scan, ou nom du fichier
+            des sous-domaines valides (les autres fichiers en dérivent, voir ResultFiles).
+        prober (HttpProber): Sondeur HTTP partagé.
+    """
+    unique_subdomains = subdomains if hasattr(subdomains, "__aiter__") else set(subdomains)
+
+    files = output_file if isinstance(output_file, ResultFiles) else ResultFiles(output_file)
+    try:
+        # Les sondes de tous les domaines partagent la boucle, le pool de connexions et les limites du sondeur
+        async for subdomain, http_codes, ports, ip_address in prober.probe_all(unique_subdomains, domain):
+            files.write(domain, subdomain, http_codes, ports, ip_address, prober.pop_details(subdomain))
+        files.domain_done(domain)
+    finally:
+        if files is not output_file:
+            files.close()
@@ -0,0 +1,122 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Limites par défaut de chaque étape du pipeline
+DEFAULT_LIMITS = {
+    "enumeration": 6,   # Sous-processus findomain / assetfinder / subfinder simultanés
+    "http": 200,        # Sondes HTTP en vol
+    "dns": 100,         # Résolutions DNS en vol
+    "capture": 4,       # Captures d'écran simultanées
+}
+
+# Débits par défaut des sondes HTTP (requêtes par seconde), par adresse IP et par domaine principal
+DEFAULT_RATES = {
+    "ip": 20,       # Sondes vers une même adresse IP (CDN, répartiteur de charge)
+    "apex": 100,    # Sondes vers les sous-domaines d'un même domaine principal
+}
+
+# Nombre de seaux au-delà duquel les seaux pleins (inactifs) sont oubliés
+MAX_IDLE_BUCKETS = 10000
+
+class TokenBucket:
+    """
+    Seau à jetons : autorise un débit moyen de rate requêtes par seconde, avec des rafales de burst requêtes.
+    Les demandes en attente sont servies dans leur ordre d'arrivée.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self):
+        self.refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+class RateLimiter:
+    """
+    Un seau à jetons par clé (adresse IP, domaine principal...), créé à la première demande.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    async def acquire(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_IDLE_BUCKETS:
+                self.buckets = {k: b for k, b in self.buckets.items() if not b.is_full() or b.lock.locked()}
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+class Scheduler:
+    """
+    Ordonnanceur unique du pipeline : une seule boucle asyncio et une limite de
+    concurrence par étape, partagées par tous les domaines traités, ainsi que des
+    limites de débit par clé (adresse IP, domaine principal).
+
+    Args:
+        limits (dict): Limites par étape ; les valeurs absentes ou nulles reprennent DEFAULT_LIMITS.
+        rates (dict): Débits (requêtes par seconde) par type de clé ; les valeurs absentes reprennent
+            DEFAULT_RATES, une valeur nulle (0) supprime la limite.
+    """
+
+    def __init__(self, limits=None, rates=None):
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits:
+            self.limits.update({stage: limit for stage, limit in limits.items() if limit})
+        self.semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.limits.items()}
+        self.executors = {}
+
+        self.rates = dict(DEFAULT_RATES)
+        if rates:
+            self.rates.update({kind: rate for kind, rate in rates.items() if rate is not None})
+        self.rate_limiters = {kind: RateLimiter(rate) for kind, rate in self.rates.items() if rate}
+
+    def stage(self, name):
+        """
+        Renvoie le sémaphore de l'étape, à utiliser avec `async with`.
+        """
+        return self.semaphores[name]
+
+    async def throttle(self, kind, key):
+        """
+        Attend que le débit de la clé (par exemple kind="ip", key="192.0.2.1") autorise une nouvelle requête.
+        """
+        limiter = self.rate_limiters.get(kind)
+        if limiter is not None and key:
+            await limiter.acquire(key)
+
+    async def run_blocking(self, stage, func, *args):
+        """
+        Exécute une fonction bloquante dans le pool de threads de l'étape, sans dépasser sa limite.
+        """
+        if stage not in self.executors:
+            self.executors[stage] = ThreadPoolExecutor(max_workers=self.limits[stage])
+
+        async with self.semaphores[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executors[stage], func, *args)
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        self.executors.clear()
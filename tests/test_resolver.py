@@ -0,0 +1,141 @@
+import asyncio
+import struct
+
+from resolver import (
+    DnsResolver, ResolverStage, StubDnsServer, Resolution, encode_query, read_question, _StubDnsProtocol,
+    QTYPE_A, RCODE_NXDOMAIN, DEFAULT_NEGATIVE_TTL,
+)
+
+class CountingStubDnsServer(StubDnsServer):
+    """
+    Serveur de test qui compte les requêtes reçues.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queries = 0
+
+    def answer(self, query):
+        self.queries += 1
+        return super().answer(query)
+
+class _LateReplyProtocol(_StubDnsProtocol):
+    # Avant chaque réponse, envoie avec le même identifiant la réponse à une autre question (réponse tardive)
+    def datagram_received(self, data, addr):
+        query_id = struct.unpack("!H", data[:2])[0]
+        self.transport.sendto(self.server.answer(encode_query(query_id, "other.test", QTYPE_A)), addr)
+        super().datagram_received(data, addr)
+
+class LateReplyStubDnsServer(StubDnsServer):
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _LateReplyProtocol(self), local_addr=(self.host, self.port)
+        )
+        self.address = self.transport.get_extra_info("sockname")[:2]
+        return self.address
+
+# Fonction pour exécuter un scénario avec un serveur DNS de test démarré
+def run_with_server(server, scenario):
+    async def run():
+        await server.start()
+        resolver = DnsResolver([server.address], timeout=0.5, attempts=1)
+        try:
+            return await scenario(resolver)
+        finally:
+            resolver.close()
+            server.close()
+    return asyncio.run(run())
+
+def test_resolve_returns_all_addresses():
+    server = StubDnsServer({"www.example.test": ["192.0.2.1", "192.0.2.2", "2001:db8::1"]})
+    resolution = run_with_server(server, lambda resolver: resolver.resolve("www.example.test"))
+    assert resolution.status == "NOERROR"
+    assert set(resolution.addresses) == {"192.0.2.1", "192.0.2.2", "2001:db8::1"}
+    assert resolution.ttl == 60
+
+def test_resolve_nxdomain():
+    server = StubDnsServer({"www.example.test": ["192.0.2.1"]})
+    resolution = run_with_server(server, lambda resolver: resolver.resolve("absent.example.test"))
+    assert resolution == Resolution("NXDOMAIN", (), DEFAULT_NEGATIVE_TTL)
+
+def test_reply_matched_by_id_and_question():
+    server = LateReplyStubDnsServer({"www.example.test": ["192.0.2.1"], "other.test": ["203.0.113.9"]})
+    resolution = run_with_server(server, lambda resolver: resolver.resolve("www.example.test"))
+    # La réponse à other.test, reçue avec le même identifiant, est ignorée
+    assert resolution.addresses == ("192.0.2.1",)
+
+def test_reply_with_other_question_is_ignored():
+    server = StubDnsServer({"www.example.test": ["192.0.2.1"], "other.test": ["203.0.113.9"]})
+    server.answer = lambda query, answer=server.answer: answer(
+        encode_query(struct.unpack("!H", query[:2])[0], "other.test", QTYPE_A)
+    )
+    assert run_with_server(server, lambda resolver: resolver.query("www.example.test", QTYPE_A)) is None
+
+def test_read_question():
+    query = encode_query(1234, "WWW.Example.test.", QTYPE_A)
+    assert read_question(query) == ("www.example.test", QTYPE_A)
+
+def test_stub_answers_nxdomain_rcode():
+    server = StubDnsServer({})
+    reply = server.answer(encode_query(7, "absent.test", QTYPE_A))
+    assert struct.unpack("!H", reply[:2])[0] == 7
+    assert struct.unpack("!H", reply[2:4])[0] & 0x000F == RCODE_NXDOMAIN
+
+def test_stage_caches_by_ttl():
+    server = CountingStubDnsServer({"www.example.test": ["192.0.2.1"]})
+
+    async def scenario(resolver):
+        stage = ResolverStage(resolver)
+        first = await stage.resolve("www.example.test")
+        server.records["www.example.test"] = ["192.0.2.99"]
+        second = await stage.resolve("WWW.example.test.")
+        return first, second
+
+    first, second = run_with_server(server, scenario)
+    assert first == second
+    assert server.queries == 2  # A et AAAA, une seule fois
+
+def test_stage_does_not_cache_zero_ttl():
+    server = CountingStubDnsServer({"www.example.test": ["192.0.2.1"]}, ttl=0)
+
+    async def scenario(resolver):
+        stage = ResolverStage(resolver)
+        await stage.resolve("www.example.test")
+        server.records["www.example.test"] = ["192.0.2.99"]
+        return await stage.resolve("www.example.test")
+
+    assert run_with_server(server, scenario).addresses == ("192.0.2.99",)
+    assert server.queries == 4
+
+def test_stage_deduplicates_inflight_queries():
+    server = CountingStubDnsServer({"www.example.test": ["192.0.2.1"]})
+
+    async def scenario(resolver):
+        stage = ResolverStage(resolver)
+        return await asyncio.gather(*(stage.resolve("www.example.test") for _ in range(10)))
+
+    resolutions = run_with_server(server, scenario)
+    assert all(resolution.addresses == ("192.0.2.1",) for resolution in resolutions)
+    assert server.queries == 2
+
+def test_wildcard_detection():
+    server = StubDnsServer({
+        "*.wild.test": ["198.51.100.7"],
+        "real.wild.test": ["198.51.100.8"],
+        "www.plain.test": ["192.0.2.1"],
+    })
+
+    async def scenario(resolver):
+        stage = ResolverStage(resolver)
+        results = {}
+        for subdomain, domain in (("any.wild.test", "wild.test"), ("real.wild.test", "wild.test"), ("www.plain.test", "plain.test")):
+            resolution = await stage.resolve(subdomain)
+            results[subdomain] = await stage.is_wildcard(subdomain, domain, resolution)
+        return results
+
+    assert run_with_server(server, scenario) == {
+        "any.wild.test": True,     # Ne répond que par la zone wildcard
+        "real.wild.test": False,   # Adresse propre, distincte de celle du wildcard
+        "www.plain.test": False,   # Zone sans wildcard
+    }
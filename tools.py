@@ -1,12 +1,38 @@
-import subprocess 
-import concurrent.futures
+import os
+import time
+import asyncio
+import contextlib
+from urllib.parse import quote
+from scheduler import Scheduler
 
-def run_tool(command, tool_name):
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.stdout.splitlines()
-    except Exception as e:
-        return []
+# Cache de l'énumération d'un scan à l'autre : répertoire et durée de validité par défaut (en heures)
+ENUMERATION_CACHE_DIRECTORY = "./cache/enumeration"
+DEFAULT_ENUMERATION_CACHE_TTL = 72
+
+async def run_tool(command, tool_name, scheduler):
+    """
+    Exécute un outil d'énumération et renvoie ses lignes de sortie au fur et à mesure qu'il les émet.
+    Une exception est levée si l'outil ne peut pas être lancé ou échoue : sa sortie est alors incomplète.
+    """
+    # Le nombre de sous-processus d'énumération simultanés est borné par l'ordonnanceur
+    async with scheduler.stage("enumeration"):
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+
+        try:
+            async for line in process.stdout:
+                yield line.decode("utf-8", errors="replace").rstrip("\r\n")
+        except BaseException:
+            # Arrêt anticipé (erreur ou annulation) : ne pas laisser l'outil tourner
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            raise
+        finally:
+            await process.wait()
+
+        if process.returncode != 0:
+            raise RuntimeError(f"{tool_name} s'est terminé avec le code {process.returncode}")
 
 def clean_subdomain(subdomain, domain):
     """
@@ -22,20 +48,107 @@ def clean_subdomain(subdomain, domain):
     else:
         return None
 
-def collect_subdomains(domain, tools):
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(run_tool, tool(domain), tool_name): tool_name for tool_name, tool in tools.items()}
-        subdomains = set()
-        for future in concurrent.futures.as_completed(futures):
-            tool_name = futures[future]
+class EnumerationCache:
+    """
+    Cache de l'énumération d'un scan à l'autre : les sous-domaines trouvés par un outil pour un domaine sont
+    réutilisés tant qu'ils ont moins de ttl heures, sans relancer l'outil. Seules les exécutions complètes
+    et réussies sont enregistrées, un fichier par couple (outil, domaine) dans le répertoire du cache.
+
+    Args:
+        directory (str): Répertoire du cache.
+        ttl (float): Durée de validité d'une énumération, en heures.
+        refresh (bool): Relancer tous les outils sans lire le cache (les nouveaux résultats y sont enregistrés).
+    """
+
+    def __init__(self, directory=ENUMERATION_CACHE_DIRECTORY, ttl=DEFAULT_ENUMERATION_CACHE_TTL, refresh=False):
+        self.directory = directory
+        self.ttl = ttl * 3600
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, tool_name, domain):
+        return os.path.join(self.directory, quote(tool_name, safe=""), f"{quote(domain, safe='')}.txt")
+
+    def get(self, tool_name, domain):
+        """
+        Renvoie les sous-domaines enregistrés pour l'outil et le domaine, ou None s'ils sont absents ou expirés.
+        """
+        path = self.path(tool_name, domain)
+        if not self.refresh:
             try:
-                result = future.result()
-                for subdomain in result:
-                    cleaned_subdomain = clean_subdomain(subdomain, domain)
-                    if cleaned_subdomain:
-                        subdomains.add(cleaned_subdomain)
-            except Exception as e:
+                if time.time() - os.path.getmtime(path) < self.ttl:
+                    with open(path, encoding="utf-8") as file:
+                        subdomains = file.read().splitlines()
+                    self.hits += 1
+                    return subdomains
+            except OSError:
                 pass
-    
-    return list(subdomains)
+        self.misses += 1
+        return None
+
+    def put(self, tool_name, domain, subdomains):
+        path = self.path(tool_name, domain)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : une énumération interrompue n'est jamais lue à moitié
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.writelines(f"{subdomain}\n" for subdomain in subdomains)
+        os.replace(temporary_path, path)
+
+async def stream_subdomains(domain, tools, scheduler=None, cache=None):
+    """
+    Lance tous les outils en parallèle et renvoie chaque sous-domaine dès qu'un outil l'émet,
+    dédoublonné à la volée.
+
+    Args:
+        domain (str): Le domaine à énumérer.
+        tools (dict): Dictionnaire des outils de collecte de sous-domaines.
+        scheduler (Scheduler): Ordonnanceur du pipeline.
+        cache (EnumerationCache): Cache de l'énumération ; les outils dont le résultat est en cache ne sont pas lancés.
+    """
+    scheduler = scheduler or Scheduler()
+    queue = asyncio.Queue()
+    seen = set()
 
+    async def emit(subdomain):
+        if subdomain not in seen:
+            seen.add(subdomain)
+            await queue.put(subdomain)
+
+    async def feed(command, tool_name):
+        cached = cache.get(tool_name, domain) if cache else None
+        if cached is not None:
+            for subdomain in cached:
+                await emit(subdomain)
+            return
+
+        found = []
+        try:
+            async for line in run_tool(command, tool_name, scheduler):
+                cleaned_subdomain = clean_subdomain(line, domain)
+                if cleaned_subdomain:
+                    found.append(cleaned_subdomain)
+                    await emit(cleaned_subdomain)
+        except (OSError, RuntimeError) as e:
+            # Outil absent ou en échec : les sous-domaines déjà émis sont gardés, mais pas mis en cache
+            print(f"⚠  Énumération de {domain} avec {tool_name} interrompue : {e}")
+            return
+        if cache:
+            cache.put(tool_name, domain, dict.fromkeys(found))
+
+    async def feed_all():
+        try:
+            await asyncio.gather(*(feed(tool(domain), tool_name) for tool_name, tool in tools.items()))
+        finally:
+            await queue.put(None)  # Fin du flux
+
+    feeder = asyncio.create_task(feed_all())
+    try:
+        while (subdomain := await queue.get()) is not None:
+            yield subdomain
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await feeder
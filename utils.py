@@ -1,17 +1,28 @@
-import subprocess
-
-def print_message(message, symbol="*"):
-    print(f"\n{symbol * 10} {message} {symbol * 10}\n")
-
-def is_tool_installed(tool_name):
-    try:
-        result = subprocess.run([tool_name, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return result.returncode == 0
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def prompt_install_tool(tool_name):
-    if not is_tool_installed(tool_name):
-        answer = input(f"{tool_name} n'est pas installé. Souhaitez-vous l'installer ? (yes/no): ").lower()
-        if answer in ['yes', 'y']:
-            pass  # Logique pour installer l'outil
+import subprocess
+import argparse
+
+def print_message(message, symbol="*"):
+    print(f"\n{symbol * 10} {message} {symbol * 10}\n")
+
+def is_tool_installed(tool_name):
+    try:
+        result = subprocess.run([tool_name, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return result.returncode == 0
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+def prompt_install_tool(tool_name):
+    if not is_tool_installed(tool_name):
+        answer = input(f"{tool_name} n'est pas installé. Souhaitez-vous l'installer ? (yes/no): ").lower()
+        if answer in ['yes', 'y']:
+            pass  # Logique pour installer l'outil
+
+# Type argparse des options qui attendent un entier strictement positif (taille de page, etc.)
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"entier attendu : {value!r}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"entier strictement positif attendu : {value}")
+    return number